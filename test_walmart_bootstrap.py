@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from walmart_bootstrap import bca_interval, bootstrap_means, bootstrap_segments, percentile_interval
+
+CONFIDENCE_LEVELS = [0.90, 0.95, 0.99]
+
+
+@pytest.mark.parametrize('values', [[5000.0], [5000.0, 5000.0, 5000.0]])
+def test_bca_degenerate_segment_gives_mean_interval(values):
+    boot_means = bootstrap_means([np.array(values)], n_resamples=200)[0]
+    bounds = bca_interval(values, boot_means, CONFIDENCE_LEVELS)
+    assert bounds.shape == (len(CONFIDENCE_LEVELS), 2)
+    assert (bounds == np.mean(values)).all()
+
+
+def test_bca_stays_finite_when_resamples_fall_on_one_side():
+    values = np.array([1.0, 1.0, 1.0, 1.0, 100.0])
+    boot_means = bootstrap_means([values], n_resamples=500)[0]
+    bounds = bca_interval(values, boot_means, CONFIDENCE_LEVELS)
+    assert np.isfinite(bounds).all()
+    assert (bounds[:, 0] <= bounds[:, 1]).all()
+
+
+def test_bca_close_to_percentile_for_a_large_symmetric_sample():
+    values = np.random.default_rng(0).normal(9_000, 5_000, 20_000)
+    boot_means = bootstrap_means([values], n_resamples=2_000)[0]
+    bca = bca_interval(values, boot_means, CONFIDENCE_LEVELS)
+    percentile = percentile_interval(boot_means, CONFIDENCE_LEVELS)
+    assert np.abs(bca - percentile).max() < 0.1 * (percentile[:, 1] - percentile[:, 0]).min()
+
+
+def test_bootstrap_segments_bca_with_tiny_segments():
+    df = pd.DataFrame({'Purchase': [5000, 5000, 7000, 100, 200, 300],
+                       'Gender': pd.Categorical(['F', 'F', 'M', 'X', 'X', 'X'])})
+    table = bootstrap_segments(df, ['Gender'], CONFIDENCE_LEVELS, method='bca', n_resamples=200)
+    assert np.isfinite(table[['lower', 'upper']].to_numpy()).all()
+    single = table[table['level'].isin(['F', 'M'])]
+    assert (single['lower'] == single['mean']).all() and (single['upper'] == single['mean']).all()
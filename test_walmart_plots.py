@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pytest
+
+from walmart_aggregate import aggregate
+from walmart_analysis import BOX_PLOTS, CATEGORICAL_FEATURES
+from walmart_loader import prepare_frame
+from walmart_plots import KDE_GRID_POINTS, eda_figures, histogram_summary, render_all
+from walmart_streaming import GROUP_COLUMNS
+from walmart_synth import write_csv
+
+
+@pytest.mark.parametrize('values', [
+    np.random.default_rng(0).integers(100, 20_000, 12),
+    np.r_[np.random.default_rng(1).normal(1_000, 50, 300), np.random.default_rng(2).normal(20_000, 50, 300)],
+    np.array([5_000.0]),
+    np.array([5_000.0, 5_000.0, 5_000.0]),
+])
+def test_kde_stays_on_the_grid_for_small_inputs(values):
+    summary = histogram_summary(values)
+    assert len(summary['grid']) == len(summary['kde']) == KDE_GRID_POINTS
+    assert np.isfinite(summary['kde']).all()
+
+
+def test_kde_matches_direct_evaluation():
+    values = np.random.default_rng(3).lognormal(9.0, 0.5, 2_000)
+    summary = histogram_summary(values)
+    bandwidth = values.std(ddof=1) * len(values) ** (-1 / 5)
+    grid = summary['grid']
+    density = np.exp(-0.5 * ((grid[:, None] - values[None, :]) / bandwidth) ** 2).sum(axis=1)
+    density /= len(values) * bandwidth * np.sqrt(2 * np.pi)
+    expected = density * len(values) * (summary['edges'][1] - summary['edges'][0])
+    assert np.abs(summary['kde'] - expected).max() <= 0.01 * expected.max()
+
+
+def test_report_figures_render_for_a_tiny_file(tmp_path):
+    path = os.path.join(tmp_path, 'tiny.csv')
+    write_csv(path, 12, seed=0)
+    df = prepare_frame(path)
+    summary = aggregate(df, [column for column in GROUP_COLUMNS if column in df.columns])
+    figures = [{**spec, 'filename': os.path.join(tmp_path, spec['filename'])}
+               for spec in eda_figures(df, summary, BOX_PLOTS, CATEGORICAL_FEATURES)]
+    for filename in render_all(figures):
+        assert os.path.getsize(filename) > 0
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from walmart_cube import SegmentCube
+from walmart_loader import AGE_CATEGORIES, add_age_group
+from walmart_rollup import top_segments
+
+
+def test_top_segment_shares_are_of_all_spend():
+    rng = np.random.default_rng(0)
+    n = 5_000
+    df = pd.DataFrame({
+        'Gender': pd.Categorical(rng.choice(['F', 'M'], n), categories=['F', 'M']),
+        'Age': pd.Categorical(rng.choice(['18-25', '26-35', '36-45'], n)),
+        'Occupation': rng.integers(0, 21, n),
+        'City_Category': pd.Categorical(rng.choice(['A', 'B', 'C'], n)),
+        'Stay_In_Current_City_Years': pd.Categorical(rng.choice(['0', '1', '2', '3', '4+'], n)),
+        'Marital_Status': rng.integers(0, 2, n),
+        'Purchase': rng.integers(100, 20_000, n),
+    })
+    # Rows with a blank Gender are left out of the cube but still count towards all spend
+    df.loc[::10, 'Gender'] = np.nan
+    df = add_age_group(df.astype({'Age': pd.CategoricalDtype(AGE_CATEGORIES, ordered=True)}))
+    cube = SegmentCube().update(df)
+    assert cube.unmatched == df['Gender'].isna().sum()
+
+    total_spend = df['Purchase'].sum()
+    table = top_segments(cube, ['Gender', 'City_Category'], k=6, total_spend=total_spend)
+    expected = df.groupby(['Gender', 'City_Category'], observed=True)['Purchase'].sum() / total_spend
+    for row in table.itertuples(index=False):
+        assert np.isclose(row.share, expected[(row.Gender, row.City_Category)])
+    assert table['share'].sum() < 0.95
+    assert np.isclose(top_segments(cube, ['Gender'], k=2)['share'].sum(), 1.0)
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from walmart_aggregate import aggregate, confidence_intervals, summary_from_group_stats
+from walmart_loader import prepare_frame
+from walmart_service import load_index
+from walmart_state import aggregate_files
+from walmart_synth import write_csv
+
+
+@pytest.fixture(scope='module')
+def blank_csv(tmp_path_factory):
+    """A synthetic file where some rows have a blank Gender or City_Category, which the cube leaves out."""
+    directory = tmp_path_factory.mktemp('service')
+    path = os.path.join(directory, 'synth.csv')
+    write_csv(path, 20_000, seed=5)
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    df.loc[::97, 'Gender'] = ''
+    df.loc[::151, 'City_Category'] = ''
+    blank_path = os.path.join(directory, 'blank.csv')
+    df.to_csv(blank_path, index=False)
+    return blank_path
+
+
+def test_single_levels_and_overall_match_the_report(blank_csv):
+    index = load_index(blank_csv)
+    df = prepare_frame(blank_csv)
+    report = confidence_intervals(aggregate(df, ['Gender', 'City_Category', 'Age']), [0.95])
+    streamed = summary_from_group_stats(aggregate_files([blank_csv]).group_stats)
+    queries = [{'segment': {row.dimension: row.level}} for row in report.itertuples()]
+    for row, result in zip(report.itertuples(), index.evaluate(queries)):
+        assert result['count'] == row.count
+        assert result['mean'] == pytest.approx(row.mean, rel=1e-12)
+        assert result['lower'] == pytest.approx(row.lower, rel=1e-12)
+        assert result['upper'] == pytest.approx(row.upper, rel=1e-12)
+        match = streamed[(streamed['dimension'] == row.dimension) & (streamed['level'] == row.level)]
+        assert result['count'] == match['count'].iloc[0]
+
+    overall = index.evaluate([{'op': 'mean', 'segment': {}}])[0]
+    assert overall['count'] == len(df)
+    assert overall['mean'] == pytest.approx(df['Purchase'].mean(), rel=1e-12)
+    assert overall['std'] == pytest.approx(df['Purchase'].std(), rel=1e-9)
+
+
+def test_combinations_match_pandas(blank_csv):
+    index = load_index(blank_csv)
+    df = prepare_frame(blank_csv)
+    groups = df.groupby(['Gender', 'City_Category'], observed=True)['Purchase'].agg(['count', 'mean'])
+    queries = [{'op': 'mean', 'segment': {'Gender': gender, 'City_Category': city}} for gender, city in groups.index]
+    results = index.evaluate(queries)
+    assert [result['count'] for result in results] == groups['count'].tolist()
+    assert np.allclose([result['mean'] for result in results], groups['mean'], rtol=1e-12)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from walmart_plots import sketch_histogram_summary
+from walmart_sketch import KLLSketch, SegmentSketches, max_rank_error
+
+RANK_ERROR = 0.01
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+
+def purchases(n, seed=0):
+    """Right-skewed, heavily repeated integer amounts, like the Purchase column."""
+    rng = np.random.default_rng(seed)
+    return pd.Series(np.rint(rng.lognormal(9.0, 0.5, n)), name='Purchase')
+
+
+def rank_error(values, estimates, quantiles):
+    """Distance of each estimate's true rank range in `values` from its target quantile."""
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    low = np.searchsorted(values, estimates, side='left') / len(values)
+    high = np.searchsorted(values, estimates, side='right') / len(values)
+    return np.where(quantiles < low, low - quantiles, np.where(quantiles > high, quantiles - high, 0.0))
+
+
+def assert_matches_pandas(sketch, series):
+    """Sketch quantiles within RANK_ERROR of Series.quantile() in rank; count, min and max exact."""
+    exact = series.quantile(QUANTILES).to_numpy()
+    estimates = sketch.quantile(QUANTILES)
+    assert rank_error(series, estimates, QUANTILES).max() <= RANK_ERROR
+    # The exact quantiles themselves sit at their own ranks, so compare the two in rank space
+    assert np.abs(sketch.rank(estimates) - sketch.rank(exact)).max() <= 2 * RANK_ERROR
+    assert max_rank_error(sketch, series) <= RANK_ERROR
+    assert sketch.count == len(series)
+    assert sketch.min == series.min() and sketch.max == series.max()
+
+
+def test_single_sketch_matches_pandas_quantiles():
+    series = purchases(200_000)
+    assert_matches_pandas(KLLSketch(RANK_ERROR).update(series.to_numpy()), series)
+
+
+def test_chunked_updates_match_pandas_quantiles():
+    series = purchases(200_000, seed=1)
+    sketch = KLLSketch(RANK_ERROR)
+    for chunk in np.array_split(series.to_numpy(), 17):
+        sketch.update(chunk)
+    assert_matches_pandas(sketch, series)
+
+
+def test_merged_shard_sketches_match_pandas_quantiles():
+    shards = [purchases(n, seed=seed) for seed, n in enumerate([50_000, 80_000, 5_000, 120_000, 1], start=2)]
+    merged = KLLSketch(RANK_ERROR)
+    for seed, shard in enumerate(shards):
+        shard_sketch = KLLSketch(RANK_ERROR, seed=seed)
+        for chunk in np.array_split(shard.to_numpy(), 4):
+            shard_sketch.update(chunk)
+        merged.merge(KLLSketch.from_dict(shard_sketch.to_dict()))
+    assert_matches_pandas(merged, pd.concat(shards, ignore_index=True))
+
+
+def test_segment_sketches_describe_matches_pandas():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({'Purchase': purchases(150_000, seed=3),
+                       'Gender': rng.choice(['F', 'M'], 150_000, p=[0.25, 0.75])})
+    shards = [SegmentSketches(['Gender'], rank_error=RANK_ERROR).update(chunk)
+              for chunk in (df.iloc[:40_000], df.iloc[40_000:100_000], df.iloc[100_000:])]
+    sketches = shards[0]
+    for other in shards[1:]:
+        sketches.merge(other)
+
+    exact = df['Purchase'].describe()
+    described = sketches.describe(mean=exact['mean'], std=exact['std'])
+    for row in ('count', 'mean', 'std', 'min', 'max'):
+        assert described[row] == exact[row]
+    quartiles = np.array([0.25, 0.5, 0.75])
+    estimates = described[['25%', '50%', '75%']].to_numpy(dtype=np.float64)
+    assert rank_error(df['Purchase'], estimates, quartiles).max() <= RANK_ERROR
+
+    for level, segment in df.groupby('Gender')['Purchase']:
+        assert_matches_pandas(sketches.segments['Gender'][level], segment)
+
+
+def test_empty_sketch():
+    sketch = KLLSketch(RANK_ERROR)
+    assert sketch.count == 0
+    assert np.isnan(sketch.quantile(0.5))
+    assert np.isnan(sketch.quantile([0.25, 0.75])).all()
+    assert np.isnan(sketch.rank([1.0, 2.0])).all()
+    assert sketch.rank([1.0, 2.0]).shape == (2,)
+
+    summary = sketch_histogram_summary(sketch, bins=10)
+    assert summary['counts'].sum() == 0 and len(summary['edges']) == 11
+
+    merged = KLLSketch(RANK_ERROR).update([5.0, 7.0]).merge(sketch)
+    assert merged.count == 2 and merged.quantile(0.0) == 5.0 and merged.quantile(1.0) == 7.0
+
+    described = SegmentSketches(['Gender']).describe()
+    assert described['count'] == 0
+    assert np.isnan(described['50%'])
+
+
+@pytest.mark.parametrize('rank_error_bound', [0.05, 0.02])
+def test_coarser_bounds_hold(rank_error_bound):
+    series = purchases(100_000, seed=4)
+    sketch = KLLSketch(rank_error_bound).update(series.to_numpy())
+    assert max_rank_error(sketch, series) <= rank_error_bound
@@ -1,73 +1,41 @@
-import pandas as pd
+import argparse
+import os
+import sys
+
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from scipy import stats
-
-# Load the dataset
-try:
-    df = pd.read_csv('walmart_data.csv')
-    print("Dataset loaded successfully.")
-except FileNotFoundError:
-    print("Error: walmart_data.csv not found in the current directory.")
-    exit()
-
-print("\n--- Initial Data Analysis ---")
-
-# Display basic information
-print("\n1. Basic Information:")
-print("Shape of the dataset:", df.shape)
-print("\nData Types and Non-Null Counts:")
-df.info()
-
-# Display statistical summary
-print("\n2. Statistical Summary:")
-print(df.describe(include='all'))
-
-# Check for null values
-print("\n3. Null Value Counts:")
-print(df.isnull().sum())
-
-# --- Data Cleaning and Preparation ---
-print("\n--- Data Cleaning and Preparation ---")
-
-# Handle missing values
-# Product_Category_2 and Product_Category_3 have significant missing values.
-# For this analysis, we might not need them directly for the core questions,
-# but if we were building a predictive model, we'd need a strategy (e.g., imputation, treating as a separate category).
-# Let's fill with 0 or a placeholder for now, assuming missing means the category doesn't apply or wasn't recorded.
-# However, the prompt focuses on Purchase amount vs Gender, Age, Marital Status, so let's check if 'Purchase' has NaNs.
-if df['Purchase'].isnull().any():
-    print("\nWarning: 'Purchase' column contains missing values. Dropping rows with missing Purchase amount.")
-    df.dropna(subset=['Purchase'], inplace=True)
-else:
-    print("\n'Purchase' column has no missing values.")
-
-# Fill missing Product Categories if needed for specific analysis later, but focus on core task first.
-# For now, we'll proceed without filling Product_Category_2 & 3 as they aren't central to the main questions.
-print("\nNote: Product_Category_2 and Product_Category_3 have missing values, which are not being filled at this stage.")
-
-
-# Convert relevant columns to appropriate types
-df['Gender'] = df['Gender'].astype('category')
-df['Age'] = df['Age'].astype('category')
-df['City_Category'] = df['City_Category'].astype('category')
-df['Stay_In_Current_City_Years'] = df['Stay_In_Current_City_Years'].astype('category')
-df['Marital_Status'] = df['Marital_Status'].astype('category')
-# User_ID and Product_ID could be treated as strings or objects if not used numerically
-df['User_ID'] = df['User_ID'].astype(str)
-df['Product_ID'] = df['Product_ID'].astype(str)
-
-
-print("\nData types after conversion:")
-df.info()
+
+from walmart_aggregate import aggregate, confidence_intervals, group_means, interval, summary_from_group_stats
+from walmart_bootstrap import bootstrap_segments, ci_width_curve
+from walmart_cache import load_cached
+from walmart_cube import CUBE_DIMENSIONS, SegmentCube, pairwise_matrix, pairwise_summary, pairwise_tests
+from walmart_instrument import Instrumentation, activate, deactivate, stage
+from walmart_plots import ci_width_figure, eda_figures, render_all, sketch_figures
+from walmart_rollup import ID_COLUMNS, IdRollup, top_segments
+from walmart_state import AnalysisState, aggregate_files, shard_paths
+from walmart_loader import (AGE_GROUP_ORDER, CODE_COLUMNS, STREAM_SCHEMA, add_age_group, compact_codes,
+                            compact_purchase, load_typed, prepare_chunk, prepare_frame)
+from walmart_streaming import GROUP_COLUMNS, stream_group_stats
+
+COMMANDS = ['report', 'stats', 'plots']
+CONFIDENCE_LEVELS = [0.90, 0.95, 0.99]
+
+# EDA figures
+# 1. Univariate Analysis: distribution of Purchase Amount and count plots for categorical features
+CATEGORICAL_FEATURES = ['Gender', 'Age_Group', 'City_Category', 'Marital_Status', 'Stay_In_Current_City_Years']
+# 2. Bivariate Analysis: Purchase vs. Gender, Marital Status, Age Group and City Category
+BOX_PLOTS = [
+    ('Gender', None, 'purchase_vs_gender_boxplot.png', 'Purchase Amount vs. Gender', 'Gender'),
+    ('Marital_Status', None, 'purchase_vs_marital_status_boxplot.png', 'Purchase Amount vs. Marital Status',
+     'Marital Status (0=Single, 1=Married)'),
+    ('Age_Group', AGE_GROUP_ORDER, 'purchase_vs_age_group_boxplot.png', 'Purchase Amount vs. Age Group', 'Age Group'),
+    ('City_Category', ['A', 'B', 'C'], 'purchase_vs_city_category_boxplot.png', 'Purchase Amount vs. City Category',
+     'City Category'),
+]
 
 
 # Create Age Bins as requested
-print("\nCreating Age Bins...")
-# Define the mapping for age categories to sortable labels if needed,
-# but for binning, the original categories work.
-# Let's create a new column 'Age_Group' based on the specified bins.
+# map_age_to_group() documents the binning for a single value; the report itself bins
+# the whole column at once with walmart_loader.add_age_group(), which remaps Age category codes.
 def map_age_to_group(age_str):
     if age_str == '0-17':
         return '0-17'
@@ -82,132 +50,11 @@ def map_age_to_group(age_str):
     else:
         return 'Unknown'
 
-df['Age_Group'] = df['Age'].apply(map_age_to_group).astype('category')
-# Define the order for plotting if necessary
-age_group_order = ['0-17', '18-25', '26-35', '36-50', '51+']
-df['Age_Group'] = pd.Categorical(df['Age_Group'], categories=age_group_order, ordered=True)
-
-print("Age groups created:")
-print(df['Age_Group'].value_counts())
-
-
-# --- Exploratory Data Analysis (EDA) ---
-print("\n--- Exploratory Data Analysis (EDA) ---")
-
-# Set plot style
-sns.set(style="whitegrid")
-
-# 1. Univariate Analysis
-print("\n1. Univariate Analysis...")
-
-# Distribution of Purchase Amount
-plt.figure(figsize=(10, 6))
-sns.histplot(df['Purchase'], kde=True, bins=50)
-plt.title('Distribution of Purchase Amount')
-plt.xlabel('Purchase Amount')
-plt.ylabel('Frequency')
-# plt.show() # Displaying plots might not work directly in script execution, consider saving them.
-plt.savefig('purchase_distribution.png')
-plt.close()
-print("Saved purchase_distribution.png")
-
-# Count plots for categorical features
-categorical_features = ['Gender', 'Age_Group', 'City_Category', 'Marital_Status', 'Stay_In_Current_City_Years']
-for feature in categorical_features:
-    plt.figure(figsize=(8, 5))
-    sns.countplot(data=df, x=feature, order=df[feature].value_counts().index)
-    plt.title(f'Count Plot for {feature}')
-    plt.xlabel(feature)
-    plt.ylabel('Count')
-    plt.xticks(rotation=45 if len(df[feature].unique()) > 5 else 0)
-    plt.tight_layout()
-    plt.savefig(f'{feature}_countplot.png')
-    plt.close()
-    print(f"Saved {feature}_countplot.png")
-
-
-# 2. Bivariate Analysis
-print("\n2. Bivariate Analysis...")
-
-# Purchase vs. Gender
-plt.figure(figsize=(8, 6))
-sns.boxplot(data=df, x='Gender', y='Purchase')
-plt.title('Purchase Amount vs. Gender')
-plt.xlabel('Gender')
-plt.ylabel('Purchase Amount')
-plt.savefig('purchase_vs_gender_boxplot.png')
-plt.close()
-print("Saved purchase_vs_gender_boxplot.png")
-
-# Purchase vs. Marital Status
-plt.figure(figsize=(8, 6))
-sns.boxplot(data=df, x='Marital_Status', y='Purchase')
-plt.title('Purchase Amount vs. Marital Status')
-plt.xlabel('Marital Status (0=Single, 1=Married)')
-plt.ylabel('Purchase Amount')
-plt.savefig('purchase_vs_marital_status_boxplot.png')
-plt.close()
-print("Saved purchase_vs_marital_status_boxplot.png")
-
-# Purchase vs. Age Group
-plt.figure(figsize=(10, 6))
-sns.boxplot(data=df, x='Age_Group', y='Purchase', order=age_group_order)
-plt.title('Purchase Amount vs. Age Group')
-plt.xlabel('Age Group')
-plt.ylabel('Purchase Amount')
-plt.savefig('purchase_vs_age_group_boxplot.png')
-plt.close()
-print("Saved purchase_vs_age_group_boxplot.png")
-
-# Purchase vs. City Category
-plt.figure(figsize=(8, 6))
-sns.boxplot(data=df, x='City_Category', y='Purchase', order=['A', 'B', 'C'])
-plt.title('Purchase Amount vs. City Category')
-plt.xlabel('City Category')
-plt.ylabel('Purchase Amount')
-plt.savefig('purchase_vs_city_category_boxplot.png')
-plt.close()
-print("Saved purchase_vs_city_category_boxplot.png")
-
-# Correlation Heatmap (for numerical columns if any were relevant - Purchase is the main one)
-# Since most predictors are categorical, a heatmap isn't the primary tool here.
-# We focus on comparing Purchase across categories.
-
-
-# --- Answering Business Questions ---
-print("\n--- Answering Business Questions ---")
-
-# Q1: Are women spending more money per transaction than men? Why or Why not?
-print("\nQ1: Average Spending per Transaction by Gender")
-# Add observed=False to silence FutureWarning and maintain current behavior
-avg_spending_gender = df.groupby('Gender', observed=False)['Purchase'].mean()
-print(avg_spending_gender)
-
-male_avg = avg_spending_gender['M']
-female_avg = avg_spending_gender['F']
-
-if female_avg > male_avg:
-    print(f"\nOn average, females spend slightly more per transaction (${female_avg:.2f}) than males (${male_avg:.2f}).")
-else:
-    print(f"\nOn average, males spend slightly more or equal per transaction (${male_avg:.2f}) compared to females (${female_avg:.2f}).")
-
-# Potential Reasons (based on data exploration, requires domain knowledge for full explanation):
-# - Differences in product categories purchased (requires analyzing Product_Category vs Gender).
-# - Marketing targeting.
-# - Cultural factors.
-# The boxplot (purchase_vs_gender_boxplot.png) visually compares the distributions.
-
-
-# Q2 & Q3: Confidence intervals and distribution for mean expenses (Gender)
-print("\nQ2 & Q3: Confidence Intervals for Average Spending by Gender (using CLT)")
-
-# Separate data for male and female customers
-male_purchases = df[df['Gender'] == 'M']['Purchase']
-female_purchases = df[df['Gender'] == 'F']['Purchase']
 
 # Function to calculate confidence interval using CLT
 def calculate_confidence_interval(data, confidence=0.95):
     """Calculates the confidence interval for the mean of a dataset."""
+    from scipy import stats
     n = len(data)
     if n < 30: # Basic check for CLT applicability, though often works for smaller samples if distribution isn't heavily skewed.
         print(f"Warning: Sample size ({n}) is small for CLT assumption.")
@@ -219,167 +66,563 @@ def calculate_confidence_interval(data, confidence=0.95):
     interval = stats.norm.interval(confidence, loc=mean, scale=std_err)
     return interval
 
-# Calculate CIs for different confidence levels
-confidence_levels = [0.90, 0.95, 0.99]
-male_cis = {}
-female_cis = {}
-
-print("\nCalculating CIs with full sample data:")
-for conf in confidence_levels:
-    male_cis[conf] = calculate_confidence_interval(male_purchases, conf)
-    female_cis[conf] = calculate_confidence_interval(female_purchases, conf)
-    # Format CI output for better readability
-    print(f"  {int(conf*100)}% CI for Males:   ({male_cis[conf][0]:.2f}, {male_cis[conf][1]:.2f})")
-    print(f"  {int(conf*100)}% CI for Females: ({female_cis[conf][0]:.2f}, {female_cis[conf][1]:.2f})")
-
-# Check for overlap
-print("\nChecking for CI Overlap (Gender):")
-overlapping = {}
-for conf in confidence_levels:
-    male_lower, male_upper = male_cis[conf]
-    female_lower, female_upper = female_cis[conf]
-    # Overlap exists if one interval's start is before the other's end, AND vice-versa
-    overlap = (male_lower < female_upper) and (female_lower < male_upper)
-    overlapping[conf] = overlap
-    print(f"  {int(conf*100)}% CI Overlap: {overlap}")
-
-# Interpretation of Overlap:
-# If CIs overlap, we cannot conclude with that level of confidence that the true population means are different.
-# If CIs do not overlap, we can conclude with that level of confidence that the true population means are different.
-
-print("\nLeveraging Conclusion (Gender):")
-if overlapping[0.95]: # Using 95% as standard
-    print("  At 95% confidence, the intervals for average male and female spending overlap.")
-    print("  This suggests that while there might be a small difference in the sample averages,")
-    print("  we cannot be statistically confident that the true average spending for ALL male and female")
-    print("  customers in the population is significantly different.")
-    print("  Walmart might consider marketing strategies that appeal broadly rather than heavily gender-segmented based solely on average spend.")
-else:
-    print("  At 95% confidence, the intervals for average male and female spending DO NOT overlap.")
-    print("  This provides statistical evidence that the true average spending differs between genders in the population.")
-    # Determine who spends more based on non-overlapping intervals
-    if male_cis[0.95][0] > female_cis[0.95][1]: # Male lower bound > Female upper bound
-         print("  Males likely spend significantly more on average.")
-         print("  Walmart could tailor promotions or product recommendations differently based on gender.")
-    elif female_cis[0.95][0] > male_cis[0.95][1]: # Female lower bound > Male upper bound
-         print("  Females likely spend significantly more on average.")
-         print("  Walmart could tailor promotions or product recommendations differently based on gender.")
-
-
-# Effect of Sample Size (Demonstration - requires resampling)
-print("\nDemonstrating Effect of Sample Size on CI Width (using Male data):")
-sample_sizes = [100, 1000, 10000, 50000]
-for size in sample_sizes:
-    if size <= len(male_purchases):
-        sample = male_purchases.sample(n=size, random_state=42) # Use random_state for reproducibility
-        ci = calculate_confidence_interval(sample, 0.95)
-        width = ci[1] - ci[0]
-        print(f"  Sample Size: {size}, 95% CI: {ci}, Width: {width:.2f}")
+
+def is_sharded(args):
+    """A directory or glob of shards is aggregated file by file, in parallel, like --stream."""
+    return not args.state and (os.path.isdir(args.data_path) or any(char in args.data_path for char in '*?['))
+
+
+def load_stage(args):
+    """Load the data and print the initial data analysis.
+
+    Returns (df, state). In-memory mode gives the typed DataFrame and state None; --state,
+    --stream and sharded inputs give an AnalysisState of aggregates and df None.
+    Raises FileNotFoundError when the input is missing.
+    """
+    if args.state:
+        # Persisted-state mode: the aggregates were built by `walmart_state.py update`, one file
+        # at a time, so the report is regenerated without reading any transactions.
+        if not os.path.exists(args.state):
+            raise FileNotFoundError(f"state file {args.state} not found.")
+        state = AnalysisState.load(args.state)
+        print(f"Aggregate state loaded from {args.state} ({len(state.files)} files ingested).")
+    elif is_sharded(args):
+        # Sharded mode: every shard is aggregated in its own worker process and the partial
+        # aggregates are merged exactly, in file order, into one state.
+        shards = shard_paths(args.data_path)
+        state = aggregate_files(shards, chunksize=args.chunksize, rank_error=args.sketch_error,
+                                workers=args.workers)
+        print(f"Aggregated {len(state.files)} shard files from {args.data_path} "
+              f"(workers: {min(args.workers, len(shards))}).")
+    elif args.stream:
+        # Streaming mode: only per-group count/mean/M2 accumulators, the segment cube and
+        # mergeable quantile sketches are kept, so peak memory is bounded by --chunksize
+        # regardless of the file size.
+        state = AnalysisState(rank_error=args.sketch_error)
+        try:
+            state.group_stats, state.total_rows, null_counts = stream_group_stats(
+                args.data_path, prepare_chunk, chunksize=args.chunksize, dtype=STREAM_SCHEMA,
+                accumulators=state.accumulators())
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{args.data_path} not found.") from None
+        if null_counts is not None:
+            state.null_counts = null_counts
+        print(f"Dataset streamed successfully in chunks of {args.chunksize} rows.")
+    else:
+        try:
+            # The declared schema is applied while parsing: categorical codes for the demographics,
+            # dictionary-encoded User_ID/Product_ID and narrow numeric types.
+            if args.cache:
+                # The cache holds the table after the cleaning steps (which are then no-ops).
+                df, cache_hit = load_cached(args.data_path, prepare_frame, verify_hash=args.verify_cache)
+                print("Dataset loaded from cache." if cache_hit else "Dataset loaded successfully and cached.")
+            else:
+                df = load_typed(args.data_path)
+                print("Dataset loaded successfully.")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{args.data_path} not found.") from None
+
+        print("\n--- Initial Data Analysis ---")
+
+        # Display basic information
+        print("\n1. Basic Information:")
+        print("Shape of the dataset:", df.shape)
+        print("\nData Types and Non-Null Counts:")
+        df.info()
+
+        # Display statistical summary
+        print("\n2. Statistical Summary:")
+        print(df.describe(include='all'))
+
+        # Check for null values
+        print("\n3. Null Value Counts:")
+        print(df.isnull().sum())
+        return df, None
+
+    print("\n--- Initial Data Analysis ---")
+    print("\n1. Basic Information:")
+    print("Number of rows:", state.total_rows)
+
+    # Quartiles come from the KLL sketch (within --sketch-error of the true rank); count, mean, std,
+    # min and max are exact. Mean and std come from the all-rows moments rather than the segment cube,
+    # which leaves out rows with a blank demographic level, so they cover the same rows as the sketches.
+    print(f"\n2. Statistical Summary of Purchase (quartiles approximate, rank error <= {state.sketches.rank_error}):")
+    print(state.sketches.describe(mean=state.overall.mean, std=state.overall.sample_std))
+
+    print("\n3. Null Value Counts:")
+    print(state.null_counts)
+    print("\nNote: --stream, --state and sharded modes skip the sample-size demo and bootstrap CIs,")
+    print("which need the full Purchase column in memory.")
+    return None, state
+
+
+def clean_stage(df):
+    """Drop rows without a Purchase amount and add the Age_Group column, in place. Returns df."""
+    # --- Data Cleaning and Preparation ---
+    print("\n--- Data Cleaning and Preparation ---")
+
+    # Handle missing values
+    # Product_Category_2 and Product_Category_3 have significant missing values.
+    # For this analysis, we might not need them directly for the core questions,
+    # but if we were building a predictive model, we'd need a strategy (e.g., imputation, treating as a separate category).
+    # Let's fill with 0 or a placeholder for now, assuming missing means the category doesn't apply or wasn't recorded.
+    # However, the prompt focuses on Purchase amount vs Gender, Age, Marital Status, so let's check if 'Purchase' has NaNs.
+    if df['Purchase'].isnull().any():
+        print("\nWarning: 'Purchase' column contains missing values. Dropping rows with missing Purchase amount.")
+        df.dropna(subset=['Purchase'], inplace=True)
+    else:
+        print("\n'Purchase' column has no missing values.")
+    compact_purchase(df)
+    # Occupation and Product_Category are parsed as floats so blank cells do not abort the load;
+    # they become int8 again unless a blank was found (those rows are left out of their groupings).
+    if df[[column for column in CODE_COLUMNS if column in df.columns]].isnull().any().any():
+        print("\nWarning: Occupation or Product_Category contains missing values; those rows are left out of their groupings.")
+    compact_codes(df)
+
+    # Fill missing Product Categories if needed for specific analysis later, but focus on core task first.
+    # For now, we'll proceed without filling Product_Category_2 & 3 as they aren't central to the main questions.
+    print("\nNote: Product_Category_2 and Product_Category_3 have missing values, which are not being filled at this stage.")
+
+
+    # Column types were already set at parse time by load_typed() (see walmart_loader.SCHEMA):
+    # Gender, Age, City_Category, Stay_In_Current_City_Years and Marital_Status are categoricals with int8 codes,
+    # User_ID and Product_ID are dictionary-encoded (integer codes + lookup table) rather than Python strings,
+    # Purchase (int32) and Occupation and Product_Category (int8) were narrowed above.
+    print("\nData types after conversion:")
+    df.info()
+
+
+    # Create Age Bins as requested (vectorized remap of the Age category codes)
+    print("\nCreating Age Bins...")
+    add_age_group(df)
+
+    print("Age groups created:")
+    print(df['Age_Group'].value_counts())
+    return df
+
+
+def aggregate_stage(df=None, state=None):
+    """Per-segment summary table, segment cube and per-ID rollups, from the cleaned rows or an AnalysisState.
+
+    Returns (summary, cube, sketches, rollups). sketches is None for in-memory data, whose
+    figures are drawn from the exact rows instead. rollups maps User_ID and Product_ID to an
+    exact IdRollup in memory, or to the bounded-memory HeavyHitters of a streamed state.
+    """
+    if df is None:
+        return summary_from_group_stats(state.group_stats), state.cube, state.sketches, state.heavy_hitters
+    # Per-segment count/mean/variance/SEM of Purchase for every dimension, from one grouped
+    # pass over the codes arrays. The count plots and Q1-Q5 all read from this table;
+    # --stream builds the same table from its chunk accumulators.
+    summary = aggregate(df, [column for column in GROUP_COLUMNS if column in df.columns])
+    # Count/sum/sum-of-squares over every Gender x Age_Group x Occupation x City_Category x
+    # Marital_Status x Stay_In_Current_City_Years cell; any combination of these rolls up from it.
+    cube = SegmentCube().update(df)
+    # Count/total/mean spend per customer and per product, over the integer ID codes
+    rollups = {column: IdRollup(column).update(df) for column in ID_COLUMNS if column in df.columns}
+    return summary, cube, None, rollups
+
+
+def sample_size_curve(df):
+    """Observed and theoretical 95% CI width of male purchases over a log-spaced grid of sample sizes."""
+    # Instead of one sample per size, draw 200 samples at each size on a log-spaced grid
+    # (in batches) and compare the average 95% CI width with the theoretical 2*z*sigma/sqrt(n).
+    male_purchases = df.loc[df['Gender'] == 'M', 'Purchase'].to_numpy()
+    sample_sizes = np.unique(np.geomspace(100, len(male_purchases), 12).astype(int))
+    return ci_width_curve(male_purchases, sample_sizes, confidence=0.95, n_repeats=200, seed=42)
+
+
+def stats_stage(args, summary, cube, df=None, rollups=None, total_spend=None):
+    """Answer the business questions Q1-Q5, run the segment cube tests and list the top customers/products.
+
+    Returns the CI-width-vs-sample-size table for the plot stage (None without the raw rows).
+    """
+    # --- Answering Business Questions ---
+    print("\n--- Answering Business Questions ---")
+
+    # Q1: Are women spending more money per transaction than men? Why or Why not?
+    print("\nQ1: Average Spending per Transaction by Gender")
+    # All group means and CIs below come from the summary table,
+    # so they are identical whether the data was loaded in memory or streamed.
+    avg_spending_gender = group_means(summary, 'Gender')
+    print(avg_spending_gender)
+
+    male_avg = avg_spending_gender['M']
+    female_avg = avg_spending_gender['F']
+
+    if female_avg > male_avg:
+        print(f"\nOn average, females spend slightly more per transaction (${female_avg:.2f}) than males (${male_avg:.2f}).")
+    else:
+        print(f"\nOn average, males spend slightly more or equal per transaction (${male_avg:.2f}) compared to females (${female_avg:.2f}).")
+
+    # Potential Reasons (based on data exploration, requires domain knowledge for full explanation):
+    # - Differences in product categories purchased (requires analyzing Product_Category vs Gender).
+    # - Marketing targeting.
+    # - Cultural factors.
+    # The boxplot (purchase_vs_gender_boxplot.png) visually compares the distributions.
+
+
+    # Q2 & Q3: Confidence intervals and distribution for mean expenses (Gender)
+    print("\nQ2 & Q3: Confidence Intervals for Average Spending by Gender (using CLT)")
+
+    # Calculate CIs for different confidence levels
+    confidence_levels = CONFIDENCE_LEVELS
+    # CIs for every segment of every dimension at every confidence level, in one vectorized step
+    with stage('confidence_intervals', rows=len(summary)):
+        ci_table = confidence_intervals(summary, confidence_levels)
+    male_cis = {}
+    female_cis = {}
+
+    print("\nCalculating CIs with full sample data:")
+    for conf in confidence_levels:
+        male_cis[conf] = interval(ci_table, 'Gender', 'M', conf)
+        female_cis[conf] = interval(ci_table, 'Gender', 'F', conf)
+        # Format CI output for better readability
+        print(f"  {int(conf*100)}% CI for Males:   ({male_cis[conf][0]:.2f}, {male_cis[conf][1]:.2f})")
+        print(f"  {int(conf*100)}% CI for Females: ({female_cis[conf][0]:.2f}, {female_cis[conf][1]:.2f})")
+
+    # Bootstrap intervals: Purchase is right-skewed, so compare the CLT intervals with
+    # resampling-based ones (percentile or bias-corrected and accelerated).
+    boot_table = None
+    if args.bootstrap:
+        if df is None:
+            print("\nBootstrap CIs skipped without the raw rows (resampling needs the raw purchases in memory).")
+        else:
+            with stage('bootstrap', rows=len(df)):
+                boot_table = bootstrap_segments(df, ['Gender', 'Marital_Status', 'Age_Group'], confidence_levels,
+                                                method=args.bootstrap, n_resamples=args.resamples, seed=42,
+                                                workers=args.workers)
+            print(f"\nBootstrap CIs ({args.bootstrap}, {args.resamples} resamples):")
+            for row in boot_table[boot_table['dimension'] == 'Gender'].itertuples(index=False):
+                label = 'Males' if row.level == 'M' else 'Females'
+                print(f"  {int(row.confidence*100)}% CI for {label + ':':<9}({row.lower:.2f}, {row.upper:.2f})")
+
+    # Check for overlap
+    print("\nChecking for CI Overlap (Gender):")
+    overlapping = {}
+    for conf in confidence_levels:
+        male_lower, male_upper = male_cis[conf]
+        female_lower, female_upper = female_cis[conf]
+        # Overlap exists if one interval's start is before the other's end, AND vice-versa
+        overlap = (male_lower < female_upper) and (female_lower < male_upper)
+        overlapping[conf] = overlap
+        print(f"  {int(conf*100)}% CI Overlap: {overlap}")
+
+    # Interpretation of Overlap:
+    # If CIs overlap, we cannot conclude with that level of confidence that the true population means are different.
+    # If CIs do not overlap, we can conclude with that level of confidence that the true population means are different.
+
+    print("\nLeveraging Conclusion (Gender):")
+    if overlapping[0.95]: # Using 95% as standard
+        print("  At 95% confidence, the intervals for average male and female spending overlap.")
+        print("  This suggests that while there might be a small difference in the sample averages,")
+        print("  we cannot be statistically confident that the true average spending for ALL male and female")
+        print("  customers in the population is significantly different.")
+        print("  Walmart might consider marketing strategies that appeal broadly rather than heavily gender-segmented based solely on average spend.")
+    else:
+        print("  At 95% confidence, the intervals for average male and female spending DO NOT overlap.")
+        print("  This provides statistical evidence that the true average spending differs between genders in the population.")
+        # Determine who spends more based on non-overlapping intervals
+        if male_cis[0.95][0] > female_cis[0.95][1]: # Male lower bound > Female upper bound
+             print("  Males likely spend significantly more on average.")
+             print("  Walmart could tailor promotions or product recommendations differently based on gender.")
+        elif female_cis[0.95][0] > male_cis[0.95][1]: # Female lower bound > Male upper bound
+             print("  Females likely spend significantly more on average.")
+             print("  Walmart could tailor promotions or product recommendations differently based on gender.")
+
+
+    # Effect of Sample Size (requires resampling); the curve itself is drawn by the plot stage.
+    print("\nDemonstrating Effect of Sample Size on CI Width (using Male data):")
+    width_curve = None
+    if df is None:
+        print("  Skipped: resampling needs the raw male purchases in memory (not available with --stream, --state or shards).")
+    else:
+        with stage('sample_size'):
+            width_curve = sample_size_curve(df)
+        for row in width_curve.itertuples(index=False):
+            print(f"  Sample Size: {row.sample_size}, mean 95% CI Width: {row.mean_width:.2f} "
+                  f"(+/- {row.width_std:.2f}), theoretical: {row.theoretical_width:.2f}")
+    print("Observation: As sample size increases, the confidence interval width decreases (becomes more precise).")
+
+
+    # Q4: Results for Married vs Unmarried
+    print("\nQ4: Analysis for Marital Status")
+    avg_spending_marital = group_means(summary, 'Marital_Status')
+    print("\nAverage Spending per Transaction by Marital Status (0=Single, 1=Married):")
+    print(avg_spending_marital)
+
+    single_ci_95 = interval(ci_table, 'Marital_Status', 0, 0.95)
+    married_ci_95 = interval(ci_table, 'Marital_Status', 1, 0.95)
+
+    # Format CI output
+    print(f"\n95% CI for Average Spending (Single):   ({single_ci_95[0]:.2f}, {single_ci_95[1]:.2f})")
+    print(f"95% CI for Average Spending (Married): ({married_ci_95[0]:.2f}, {married_ci_95[1]:.2f})")
+    if boot_table is not None:
+        for row in boot_table[(boot_table['dimension'] == 'Marital_Status') & (boot_table['confidence'] == 0.95)].itertuples(index=False):
+            label = 'Single' if row.level == 0 else 'Married'
+            print(f"95% bootstrap CI ({label}): ({row.lower:.2f}, {row.upper:.2f})")
+
+    # Check overlap for Marital Status
+    single_lower, single_upper = single_ci_95
+    married_lower, married_upper = married_ci_95
+    marital_overlap = (single_lower < married_upper) and (married_lower < single_upper)
+    print(f"\nOverlap in 95% CIs for Marital Status: {marital_overlap}")
+
+    if marital_overlap:
+        print("  The confidence intervals for single and married customers overlap significantly.")
+        print("  We cannot confidently conclude a difference in true average spending based on marital status alone.")
+        print("  Marketing might not need strong differentiation based solely on marital status for average purchase value.")
+    else:
+        print("  The confidence intervals DO NOT overlap, suggesting a statistically significant difference")
+        print("  in average spending between single and married customers in the population.")
+        # Determine who spends more
+        if single_ci_95[0] > married_ci_95[1]:
+            print("  Single customers likely spend significantly more on average.")
+        elif married_ci_95[0] > single_ci_95[1]:
+            print("  Married customers likely spend significantly more on average.")
+
+
+    # Q5: Results for Age Groups
+    print("\nQ5: Analysis for Age Groups")
+    avg_spending_age = group_means(summary, 'Age_Group').reindex(AGE_GROUP_ORDER)
+    print("\nAverage Spending per Transaction by Age Group:")
+    print(avg_spending_age)
+
+    age_group_cis_95 = {}
+    print("\n95% Confidence Intervals for Average Spending by Age Group:")
+    for group in AGE_GROUP_ORDER:
+        if not np.isnan(avg_spending_age[group]):
+            age_group_cis_95[group] = interval(ci_table, 'Age_Group', group, 0.95)
+            # Format CI output
+            print(f"  {group}: ({age_group_cis_95[group][0]:.2f}, {age_group_cis_95[group][1]:.2f})")
+        else:
+            print(f"  {group}: No data available.")
+    if boot_table is not None:
+        print(f"\n95% bootstrap ({args.bootstrap}) Confidence Intervals by Age Group:")
+        for row in boot_table[(boot_table['dimension'] == 'Age_Group') & (boot_table['confidence'] == 0.95)].itertuples(index=False):
+            print(f"  {row.level}: ({row.lower:.2f}, {row.upper:.2f})")
+
+    # Check for overlaps between adjacent or key groups (e.g., youngest vs oldest, peak vs others)
+    # This can get complex to report all pairs. Let's highlight key observations.
+    print("\nObservations on Age Group CIs:")
+    # Example comparison: 26-35 vs 51+
+    if '26-35' in age_group_cis_95 and '51+' in age_group_cis_95:
+        ci1 = age_group_cis_95['26-35']
+        ci2 = age_group_cis_95['51+']
+        overlap = (ci1[0] < ci2[1]) and (ci2[0] < ci1[1])
+        print(f"  Overlap between 26-35 and 51+ CIs: {overlap}")
+        if not overlap:
+            print("    Statistically significant difference in average spending between these groups.")
     else:
-        print(f"  Sample Size: {size} exceeds available male data ({len(male_purchases)}). Skipping.")
-print("Observation: As sample size increases, the confidence interval width decreases (becomes more precise).")
-
-
-# Q4: Results for Married vs Unmarried
-print("\nQ4: Analysis for Marital Status")
-# Add observed=False to silence FutureWarning and maintain current behavior
-avg_spending_marital = df.groupby('Marital_Status', observed=False)['Purchase'].mean()
-print("\nAverage Spending per Transaction by Marital Status (0=Single, 1=Married):")
-print(avg_spending_marital)
-
-single_purchases = df[df['Marital_Status'] == 0]['Purchase']
-married_purchases = df[df['Marital_Status'] == 1]['Purchase']
-
-single_ci_95 = calculate_confidence_interval(single_purchases, 0.95)
-married_ci_95 = calculate_confidence_interval(married_purchases, 0.95)
-
-# Format CI output
-print(f"\n95% CI for Average Spending (Single):   ({single_ci_95[0]:.2f}, {single_ci_95[1]:.2f})")
-print(f"95% CI for Average Spending (Married): ({married_ci_95[0]:.2f}, {married_ci_95[1]:.2f})")
-
-# Check overlap for Marital Status
-single_lower, single_upper = single_ci_95
-married_lower, married_upper = married_ci_95
-marital_overlap = (single_lower < married_upper) and (married_lower < single_upper)
-print(f"\nOverlap in 95% CIs for Marital Status: {marital_overlap}")
-
-if marital_overlap:
-    print("  The confidence intervals for single and married customers overlap significantly.")
-    print("  We cannot confidently conclude a difference in true average spending based on marital status alone.")
-    print("  Marketing might not need strong differentiation based solely on marital status for average purchase value.")
-else:
-    print("  The confidence intervals DO NOT overlap, suggesting a statistically significant difference")
-    print("  in average spending between single and married customers in the population.")
-    # Determine who spends more
-    if single_ci_95[0] > married_ci_95[1]:
-        print("  Single customers likely spend significantly more on average.")
-    elif married_ci_95[0] > single_ci_95[1]:
-        print("  Married customers likely spend significantly more on average.")
-
-
-# Q5: Results for Age Groups
-print("\nQ5: Analysis for Age Groups")
-# Add observed=False to silence FutureWarning and maintain current behavior
-avg_spending_age = df.groupby('Age_Group', observed=False)['Purchase'].mean()
-print("\nAverage Spending per Transaction by Age Group:")
-print(avg_spending_age)
-
-age_group_cis_95 = {}
-print("\n95% Confidence Intervals for Average Spending by Age Group:")
-for group in age_group_order:
-    age_data = df[df['Age_Group'] == group]['Purchase']
-    if len(age_data) > 0:
-        age_group_cis_95[group] = calculate_confidence_interval(age_data, 0.95)
-        # Format CI output
-        print(f"  {group}: ({age_group_cis_95[group][0]:.2f}, {age_group_cis_95[group][1]:.2f})")
+        print("  Could not compare '26-35' and '51+' due to missing data or intervals.")
+
+    print("  Visual inspection of the boxplot (purchase_vs_age_group_boxplot.png) and CIs suggests")
+    print("  that while average spending varies slightly across age groups, the distributions and CIs")
+    print("  show considerable overlap, indicating average spending might not differ dramatically")
+    print("  or statistically significantly between *all* adjacent age groups.")
+    print("  However, specific groups might show differences (e.g., potentially 18-50 groups vs. 0-17 or 51+).")
+    print("  Walmart could explore targeted promotions for age groups showing distinct higher spending patterns,")
+    print("  but broad strategies might be effective across the main adult age brackets (18-50).")
+
+    # All-pairs comparison instead of the single hand-picked pair above
+    age_segments = cube.rollup(['Age_Group'])
+    with stage('pairwise_tests', rows=len(age_segments)):
+        age_pairs = pairwise_tests(age_segments, confidence=0.95, correction='holm')
+    print("\nAll-pairs Welch tests between Age Groups (Holm-adjusted p-values):")
+    print(pairwise_matrix(age_pairs, age_segments).round(4))
+
+
+    # Segment cube: combinations of demographics (see Recommendation 3)
+    print("\n--- Segment Cube: " + " x ".join(CUBE_DIMENSIONS) + " ---")
+    if cube.unmatched:
+        print(f"Note: {cube.unmatched} rows have a missing or undeclared level in a cube dimension and are not in the cube.")
+    segments = cube.rollup(CUBE_DIMENSIONS)
+    # Only the totals are printed, so the pairs are tested in blocks instead of as one
+    # row per pair (a fully populated cube has ~20M pairs)
+    with stage('segment_cube_tests', rows=len(segments)):
+        segment_pairs = pairwise_summary(segments, confidence=0.95, correction='holm')
+    print(f"Populated segments: {len(segments)} ({segment_pairs['segments']} with at least 30 transactions compared pairwise)")
+    print(f"Segment pairs tested: {segment_pairs['pairs']}, significant at 95% after Holm correction: {segment_pairs['significant']}")
+
+    for dims in (['Gender', 'Age_Group'], ['City_Category', 'Gender'], ['Occupation']):
+        rollup = cube.rollup(dims)
+        pairs = pairwise_summary(rollup, confidence=0.95, correction='holm')
+        top = rollup[rollup['count'] >= 30].nlargest(3, 'mean')
+        print(f"\nRoll-up by {' x '.join(dims)}: {len(rollup)} segments, "
+              f"{pairs['significant']} of {pairs['pairs']} pairs significantly different (Holm, 95%).")
+        print("  Highest average spending:")
+        for row in top.itertuples(index=False):
+            label = ' / '.join(str(getattr(row, dim)) for dim in dims)
+            print(f"    {label}: ${row.mean:.2f} (n={row.count})")
+
+
+    # Customers, products and segments by total spend (see Recommendations 3 and 6)
+    print("\n--- Top Customers, Products and Segments ---")
+    top_k = 5
+    id_names = {'User_ID': 'customers', 'Product_ID': 'products'}
+    for column, rollup in (rollups or {}).items():
+        exact = isinstance(rollup, IdRollup)
+        if not exact:
+            print(f"\n{id_names.get(column, column).capitalize()}: streamed SpaceSaving estimates ({rollup.by_total.capacity} counters); "
+                  f"the ranked figure may overstate by up to the +error shown.")
+        for by, title in (('total', 'total spend'), ('count', 'transactions')):
+            print(f"\nTop {top_k} {id_names.get(column, column)} ({column}) by {title}:")
+            for row in rollup.top(top_k, by=by).itertuples(index=False):
+                bound = '' if exact or row.error == 0 else f" (+{row.error:.0f})"
+                print(f"  {row[0]}: ${row.total:,.0f} over {row.count:.0f} transactions "
+                      f"(mean ${row.mean:.2f}){bound}")
+    top_segment_dims = ['Gender', 'Age_Group', 'City_Category']
+    print(f"\nTop {top_k} {' x '.join(top_segment_dims)} segments by total spend:")
+    for row in top_segments(cube, top_segment_dims, k=top_k, total_spend=total_spend).itertuples(index=False):
+        label = ' / '.join(str(getattr(row, dim)) for dim in top_segment_dims)
+        print(f"  {label}: ${row.total:,.0f} ({row.share:.1%} of all spend, n={row.count})")
+    return width_curve
+
+
+def plot_stage(args, summary, df=None, sketches=None, width_curve=None):
+    """Render the EDA figures (and the CI-width curve when given). Returns the saved filenames."""
+    # --- Exploratory Data Analysis (EDA) ---
+    print("\n--- Exploratory Data Analysis (EDA) ---")
+    if df is not None:
+        # Histogram/KDE, box statistics (quartiles, whiskers, sampled outliers) and counts are
+        # computed once per segment here; the figures are then drawn from those small summaries
+        # in parallel worker processes on a headless backend (walmart_plots.py).
+        print("\nComputing plot summaries and rendering univariate and bivariate plots...")
+        figures = eda_figures(df, summary, BOX_PLOTS, CATEGORICAL_FEATURES)
     else:
-        print(f"  {group}: No data available.")
-
-# Check for overlaps between adjacent or key groups (e.g., youngest vs oldest, peak vs others)
-# This can get complex to report all pairs. Let's highlight key observations.
-print("\nObservations on Age Group CIs:")
-# Example comparison: 26-35 vs 51+
-if '26-35' in age_group_cis_95 and '51+' in age_group_cis_95:
-    ci1 = age_group_cis_95['26-35']
-    ci2 = age_group_cis_95['51+']
-    overlap = (ci1[0] < ci2[1]) and (ci2[0] < ci1[1])
-    print(f"  Overlap between 26-35 and 51+ CIs: {overlap}")
-    if not overlap:
-        print("    Statistically significant difference in average spending between these groups.")
-else:
-    print("  Could not compare '26-35' and '51+' due to missing data or intervals.")
-
-print("  Visual inspection of the boxplot (purchase_vs_age_group_boxplot.png) and CIs suggests")
-print("  that while average spending varies slightly across age groups, the distributions and CIs")
-print("  show considerable overlap, indicating average spending might not differ dramatically")
-print("  or statistically significantly between *all* adjacent age groups.")
-print("  However, specific groups might show differences (e.g., potentially 18-50 groups vs. 0-17 or 51+).")
-print("  Walmart could explore targeted promotions for age groups showing distinct higher spending patterns,")
-print("  but broad strategies might be effective across the main adult age brackets (18-50).")
-
-
-# --- Final Insights & Recommendations ---
-print("\n--- Final Insights & Recommendations ---")
-
-print("\nKey Insights:")
-# Correction: Based on the CI calculation (non-overlap), males DO spend significantly more on average.
-print("1.  **Gender:** Males show a statistically significantly higher average spending per transaction than females (at 95% confidence). The confidence intervals for the mean spending do not overlap, indicating this difference is likely true for the broader customer population during Black Friday.")
-print("2.  **Marital Status:** The average spending per transaction between single and married customers shows overlapping confidence intervals, suggesting no statistically significant difference in the population average spending based on marital status alone.")
-print("3.  **Age:** Average spending varies across age groups. While many adjacent adult groups (18-50) have overlapping confidence intervals (similar average spending), there are statistically significant differences between some groups (e.g., the 51+ group spends more on average than the 26-35 group). The youngest (0-17) group tends to spend less.")
-print("4.  **City Category:** Visual analysis (boxplots) suggests potential differences in spending distributions based on City Category (e.g., Category C might have higher spending), warranting further investigation if needed.")
-print("5.  **Overall Purchase Distribution:** The purchase amount is right-skewed, with most purchases concentrated at lower values but a long tail of higher-value transactions.")
-print("6.  **Sample Size & Confidence:** Larger sample sizes lead to narrower (more precise) confidence intervals. Higher confidence levels (e.g., 99% vs. 90%) lead to wider intervals.")
-
-print("\nRecommendations for Walmart:")
-# Adjustment: Acknowledge the gender difference but still recommend broad appeal as primary, with potential for *some* targeting.
-print("1.  **Primary Broad Appeal Marketing:** While males show statistically higher average spending, the difference might not warrant completely separate campaigns. Focus primarily on broad Black Friday marketing appealing to all demographics with popular products and general deals, as marital status showed no significant difference in average spend.")
-print("2.  **Consider Gender-Specific Promotions (Secondary):** Given the statistically significant higher average spend by males, consider *secondary* targeted promotions or product highlights towards male-associated categories if inventory and margins support it, but avoid making it the sole strategy.")
-print("3.  **Target High-Value Segments (Beyond Averages):** Explore if specific demographics (combinations of age, occupation, city category, gender) contribute disproportionately to *total* sales volume or purchase *higher-priced items*, even if their *average* transaction value isn't vastly different. Analyze Product Category purchases within segments.")
-print("4.  **Focus on Core & High-Spending Age Groups:** The 18-50 age groups are key customer bases. Additionally, the 51+ group shows significantly higher average spending than some younger adult groups; ensure marketing messages and product assortments cater effectively to these valuable segments.")
-print("5.  **Investigate City Category Differences:** Explore why customers in certain city categories might spend more (as suggested by boxplots). This could relate to product availability, income levels, or local competition. Tailor local promotions or logistics if significant differences are confirmed.")
-print("6.  **Personalization Beyond Demographics:** Leverage User_ID and Product_ID data for personalized recommendations based on past purchase history, which is likely a stronger predictor of future spending than broad demographics alone.")
-print("7.  **Monitor Trends:** Continuously monitor these metrics over time and across different sales events to see if patterns change.")
-print("5.  **Personalization Beyond Demographics:** Leverage User_ID and Product_ID data for personalized recommendations based on past purchase history, which is likely a stronger predictor of future spending than broad demographics like gender or marital status alone for individual transaction value.")
-print("6.  **Monitor Trends:** Continuously monitor these metrics over time and across different sales events to see if patterns change.")
-
-print("\nAnalysis Complete. Plots saved as PNG files in the current directory.")
+        print("\nRendering plots from streamed counts and quantile sketches (approximate quartiles and whiskers, no KDE)...")
+        figures = sketch_figures(sketches, summary, BOX_PLOTS, CATEGORICAL_FEATURES)
+    if width_curve is not None:
+        figures.append(ci_width_figure(width_curve))
+    filenames = render_all(figures, workers=args.workers)
+    for filename in filenames:
+        print(f"Saved {filename}")
+
+    # Correlation Heatmap (for numerical columns if any were relevant - Purchase is the main one)
+    # Since most predictors are categorical, a heatmap isn't the primary tool here.
+    # We focus on comparing Purchase across categories.
+    return filenames
+
+
+def report_stage():
+    """Print the final insights and recommendations."""
+    # --- Final Insights & Recommendations ---
+    print("\n--- Final Insights & Recommendations ---")
+
+    print("\nKey Insights:")
+    # Correction: Based on the CI calculation (non-overlap), males DO spend significantly more on average.
+    print("1.  **Gender:** Males show a statistically significantly higher average spending per transaction than females (at 95% confidence). The confidence intervals for the mean spending do not overlap, indicating this difference is likely true for the broader customer population during Black Friday.")
+    print("2.  **Marital Status:** The average spending per transaction between single and married customers shows overlapping confidence intervals, suggesting no statistically significant difference in the population average spending based on marital status alone.")
+    print("3.  **Age:** Average spending varies across age groups. While many adjacent adult groups (18-50) have overlapping confidence intervals (similar average spending), there are statistically significant differences between some groups (e.g., the 51+ group spends more on average than the 26-35 group). The youngest (0-17) group tends to spend less.")
+    print("4.  **City Category:** Visual analysis (boxplots) suggests potential differences in spending distributions based on City Category (e.g., Category C might have higher spending), warranting further investigation if needed.")
+    print("5.  **Overall Purchase Distribution:** The purchase amount is right-skewed, with most purchases concentrated at lower values but a long tail of higher-value transactions.")
+    print("6.  **Sample Size & Confidence:** Larger sample sizes lead to narrower (more precise) confidence intervals. Higher confidence levels (e.g., 99% vs. 90%) lead to wider intervals.")
+
+    print("\nRecommendations for Walmart:")
+    # Adjustment: Acknowledge the gender difference but still recommend broad appeal as primary, with potential for *some* targeting.
+    print("1.  **Primary Broad Appeal Marketing:** While males show statistically higher average spending, the difference might not warrant completely separate campaigns. Focus primarily on broad Black Friday marketing appealing to all demographics with popular products and general deals, as marital status showed no significant difference in average spend.")
+    print("2.  **Consider Gender-Specific Promotions (Secondary):** Given the statistically significant higher average spend by males, consider *secondary* targeted promotions or product highlights towards male-associated categories if inventory and margins support it, but avoid making it the sole strategy.")
+    print("3.  **Target High-Value Segments (Beyond Averages):** Explore if specific demographics (combinations of age, occupation, city category, gender) contribute disproportionately to *total* sales volume or purchase *higher-priced items*, even if their *average* transaction value isn't vastly different. Analyze Product Category purchases within segments.")
+    print("4.  **Focus on Core & High-Spending Age Groups:** The 18-50 age groups are key customer bases. Additionally, the 51+ group shows significantly higher average spending than some younger adult groups; ensure marketing messages and product assortments cater effectively to these valuable segments.")
+    print("5.  **Investigate City Category Differences:** Explore why customers in certain city categories might spend more (as suggested by boxplots). This could relate to product availability, income levels, or local competition. Tailor local promotions or logistics if significant differences are confirmed.")
+    print("6.  **Personalization Beyond Demographics:** Leverage User_ID and Product_ID data for personalized recommendations based on past purchase history, which is likely a stronger predictor of future spending than broad demographics alone.")
+    print("7.  **Monitor Trends:** Continuously monitor these metrics over time and across different sales events to see if patterns change.")
+    print("5.  **Personalization Beyond Demographics:** Leverage User_ID and Product_ID data for personalized recommendations based on past purchase history, which is likely a stronger predictor of future spending than broad demographics like gender or marital status alone for individual transaction value.")
+    print("6.  **Monitor Trends:** Continuously monitor these metrics over time and across different sales events to see if patterns change.")
+
+    print("\nAnalysis Complete. Plots saved as PNG files in the current directory.")
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('data_path', nargs='?', default='walmart_data.csv',
+                        help="Path to the transaction CSV, or a directory / glob pattern of per-store shard CSVs.")
+    common.add_argument('--stream', action='store_true',
+                        help="Read the CSV in chunks and keep only per-group running statistics (for files larger than RAM).")
+    common.add_argument('--chunksize', type=int, default=100_000, help="Rows per chunk when streaming a CSV or shard.")
+    common.add_argument('--state',
+                        help="Report from a persisted aggregate state (see `python walmart_state.py update`) instead of a CSV.")
+    common.add_argument('--sketch-error', type=float, default=0.01,
+                        help="Rank error bound of the quantile sketches used for --stream box plots and quartiles.")
+    common.add_argument('--cache', action='store_true',
+                        help="Reuse a columnar cache of the cleaned table next to the CSV (rebuilt when the CSV changes).")
+    common.add_argument('--verify-cache', action='store_true',
+                        help="With --cache, also compare the CSV's content hash before trusting the cache.")
+    common.add_argument('--bootstrap', choices=['percentile', 'bca'],
+                        help="Also report bootstrap confidence intervals (needs the data in memory, so not with --stream).")
+    common.add_argument('--resamples', type=int, default=2000, help="Bootstrap resamples per segment.")
+    common.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for shard aggregation, plot rendering and the bootstrap "
+                             "(results do not depend on this).")
+    common.add_argument('--timings', metavar='PATH',
+                        help="Record wall/CPU time, peak memory and rows/sec per stage and write them to PATH as JSON.")
+    common.add_argument('--trace-memory', action='store_true',
+                        help="With --timings, also trace allocations with tracemalloc (slower; per-stage peaks).")
+    common.add_argument('--profile-dir', metavar='DIR',
+                        help="Dump a cProfile profile of every stage into DIR (implies --timings DIR/timings.json).")
+
+    parser = argparse.ArgumentParser(description="Walmart Black Friday purchase analysis.")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('report', parents=[common], help="Full report: statistics, plots and recommendations (default).")
+    subparsers.add_parser('stats', parents=[common],
+                          help="Q1-Q5, confidence intervals and segment tests only; never imports the plotting stack.")
+    subparsers.add_parser('plots', parents=[common], help="Render the EDA figures only.")
+    return parser
+
+
+def run(args):
+    """Run the stages of `args.command`, each as an instrumented stage. Returns the exit status."""
+    try:
+        with stage('load') as record:
+            df, state = load_stage(args)
+            record.rows = len(df) if df is not None else state.total_rows
+    except FileNotFoundError as error:
+        print(f"Error: {error}")
+        return 1
+    if df is not None:
+        with stage('clean', rows=len(df)):
+            clean_stage(df)
+    n_rows = len(df) if df is not None else state.total_rows
+    with stage('aggregate', rows=n_rows):
+        summary, cube, sketches, rollups = aggregate_stage(df, state)
+
+    if args.command == 'plots':
+        with stage('plots', rows=n_rows):
+            width_curve = sample_size_curve(df) if df is not None else None
+            plot_stage(args, summary, df, sketches, width_curve)
+        return 0
+    with stage('stats', rows=n_rows):
+        # Shares of all spend, including rows the cube leaves out for a blank demographic level
+        total_spend = float(df['Purchase'].sum()) if df is not None else state.overall.total
+        width_curve = stats_stage(args, summary, cube, df, rollups, total_spend)
+    if args.command == 'report':
+        with stage('plots', rows=n_rows):
+            plot_stage(args, summary, df, sketches, width_curve)
+        with stage('insights'):
+            report_stage()
+    return 0
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # `python walmart_analysis.py [data_path] [options]` keeps meaning the full report.
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv.insert(0, 'report')
+    args = build_parser().parse_args(argv)
+
+    # The stage() hooks are no-ops unless an Instrumentation is active
+    timings_path = args.timings or (os.path.join(args.profile_dir, 'timings.json') if args.profile_dir else None)
+    if timings_path is None:
+        return run(args)
+    instrumentation = activate(Instrumentation(trace_memory=args.trace_memory, profile_dir=args.profile_dir))
+    try:
+        return run(args)
+    finally:
+        deactivate()
+        instrumentation.save(timings_path, command=args.command, data_path=args.data_path)
+        print(f"\nTiming report saved to {timings_path}")
+        print(instrumentation.table()[['stage', 'wall_s', 'cpu_s', 'rows_per_s', 'peak_rss_mb']]
+              .to_string(index=False, float_format='{:.3f}'.format))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
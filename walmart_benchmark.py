@@ -0,0 +1,241 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from walmart_aggregate import aggregate, confidence_intervals
+from walmart_analysis import BOX_PLOTS, CATEGORICAL_FEATURES, CONFIDENCE_LEVELS
+from walmart_bootstrap import bootstrap_segments
+from walmart_cache import load_cached
+from walmart_cube import SegmentCube
+from walmart_instrument import cpu_seconds, max_rss_mb, peak_rss_mb, reset_peak_rss, run_metadata
+from walmart_loader import (SCHEMA, STREAM_SCHEMA, add_age_group, compact_codes, compact_purchase, prepare_chunk,
+                            prepare_frame)
+from walmart_plots import eda_figures, render_all
+from walmart_streaming import GROUP_COLUMNS, stream_group_stats
+from walmart_synth import parse_rows, write_csv
+
+BENCHMARK_FORMAT_VERSION = 1
+# In-memory stages in pipeline order, then the bounded-memory streamed pass. 'load' (read_csv with default
+# dtypes) and 'types' (astype afterwards) are a reference baseline the analysis never runs; it loads with
+# prepare_frame(), or with a warm --cache ('cached_load'), and the later stages work on that frame.
+STAGES = ['load', 'types', 'prepare_frame', 'cached_load', 'age_group', 'grouped_means', 'confidence_intervals',
+          'bootstrap', 'plots', 'stream']
+IN_MEMORY_STAGES = STAGES[:-1]
+# The in-memory stage each one works on
+REQUIRES = {'types': 'load', 'age_group': 'prepare_frame', 'grouped_means': 'age_group',
+            'confidence_intervals': 'grouped_means', 'bootstrap': 'age_group', 'plots': 'grouped_means'}
+LOAD_STAGES = ['load', 'types', 'prepare_frame', 'cached_load']
+BOOTSTRAP_DIMENSIONS = ['Gender', 'Marital_Status', 'Age_Group']
+
+
+def measure(fn, rows, repeats=1, trace_memory=True):
+    """Run `fn` `repeats` times and return (its last result, a dict of timings).
+
+    Times are medians over the repeats. Peak memory is measured in one extra run under
+    tracemalloc, because tracing every allocation slows some stages down a lot and would
+    distort the timings. numpy and pandas report their buffers to tracemalloc, so the peak
+    covers the arrays a stage allocates, not just Python objects. On Linux the peak RSS of
+    the timed runs is recorded too (see walmart_instrument).
+    """
+    walls, cpus, rss_peaks = [], [], []
+    for _ in range(repeats):
+        gc.collect()
+        rss_resettable = reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+        result = fn()
+        walls.append(time.perf_counter() - wall_start)
+        cpus.append(cpu_seconds() - cpu_start)
+        rss_peaks.append(peak_rss_mb() if rss_resettable else None)
+    timings = {'rows': rows, 'repeats': repeats, 'wall_s': float(np.median(walls)), 'cpu_s': float(np.median(cpus)),
+               'wall_s_all': walls, 'peak_rss_mb': rss_peaks[0] if None in rss_peaks else max(rss_peaks)}
+    timings['rows_per_s'] = rows / timings['wall_s'] if timings['wall_s'] > 0 else None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            timings['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        finally:
+            tracemalloc.stop()
+    timings['max_rss_mb'] = max_rss_mb()
+    return result, timings
+
+
+def convert_types(raw):
+    """The type conversion load_typed() does while parsing, applied to a frame read with default dtypes."""
+    schema = {column: dtype for column, dtype in SCHEMA.items() if column in raw.columns}
+    df = raw.astype(schema)
+    df = df.dropna(subset=['Purchase'])
+    return compact_codes(compact_purchase(df))
+
+
+def load_warm_cache(path):
+    """load_cached() with the cache already built, as a repeated `walmart_analysis.py --cache` run sees it."""
+    df, cache_hit = load_cached(path, prepare_frame)
+    if not cache_hit:
+        raise RuntimeError(f"the cache of {path} was not reused")
+    return df
+
+
+def render_into(directory, figures):
+    """Render figure specs into `directory` instead of the working directory."""
+    return render_all([{**spec, 'filename': os.path.join(directory, spec['filename'])} for spec in figures])
+
+
+def run_benchmark(path, stages=STAGES, repeats=1, trace_memory=True, n_resamples=200, workers=1,
+                  chunksize=100_000):
+    """Time every selected stage on the CSV at `path`. Returns {stage: timings} in pipeline order.
+
+    In-memory stages feed each other (see REQUIRES), so stages that are not selected but are
+    needed by a selected one still run, once and untimed. 'cached_load' builds the cache
+    next to the CSV (`<path>.cache/`, as --cache does) before it is timed, and reuses it.
+    """
+    results = {}
+    needed = set()
+    for stage in IN_MEMORY_STAGES:
+        if stage in stages:
+            while stage is not None:
+                needed.add(stage)
+                stage = REQUIRES.get(stage)
+    if needed:
+        outputs = {}
+        with tempfile.TemporaryDirectory() as plot_dir:
+            steps = {
+                'load': lambda: pd.read_csv(path),
+                'types': lambda: convert_types(outputs['load']),
+                'prepare_frame': lambda: prepare_frame(path),
+                'cached_load': lambda: load_warm_cache(path),
+                'age_group': lambda: add_age_group(outputs['prepare_frame']),
+                'grouped_means': lambda: aggregate(outputs['age_group'],
+                                                   [column for column in GROUP_COLUMNS
+                                                    if column in outputs['age_group'].columns]),
+                'confidence_intervals': lambda: confidence_intervals(outputs['grouped_means'], CONFIDENCE_LEVELS),
+                'bootstrap': lambda: bootstrap_segments(outputs['age_group'], BOOTSTRAP_DIMENSIONS, CONFIDENCE_LEVELS,
+                                                        n_resamples=n_resamples, workers=workers),
+                'plots': lambda: render_into(plot_dir, eda_figures(outputs['age_group'], outputs['grouped_means'],
+                                                                   BOX_PLOTS, CATEGORICAL_FEATURES)),
+            }
+            rows = None
+            for stage in IN_MEMORY_STAGES:
+                if stage not in needed:
+                    continue
+                if stage == 'cached_load':
+                    load_cached(path, prepare_frame)
+                if stage in stages:
+                    outputs[stage], results[stage] = measure(steps[stage], rows or 0, repeats, trace_memory)
+                else:
+                    outputs[stage] = steps[stage]()
+                if stage in LOAD_STAGES and rows is None:
+                    rows = len(outputs[stage])
+                if stage in LOAD_STAGES and stage in results:
+                    results[stage]['rows'] = len(outputs[stage])
+                    results[stage]['rows_per_s'] = len(outputs[stage]) / results[stage]['wall_s']
+                print(f"  {stage}: {_describe(results.get(stage))}")
+        del outputs
+    if 'stream' in stages:
+        def stream():
+            return stream_group_stats(path, prepare_chunk, chunksize=chunksize, dtype=STREAM_SCHEMA,
+                                      accumulators=[SegmentCube()])
+        (_, total_rows, _), results['stream'] = measure(stream, 0, repeats, trace_memory)
+        results['stream']['rows'] = total_rows
+        results['stream']['rows_per_s'] = total_rows / results['stream']['wall_s']
+        print(f"  stream: {_describe(results['stream'])}")
+    return results
+
+
+def _describe(timings):
+    if timings is None:
+        return "(not timed)"
+    text = f"{timings['wall_s']:.3f}s wall, {timings['cpu_s']:.3f}s CPU"
+    if timings.get('peak_rss_mb') is not None:
+        text += f", {timings['peak_rss_mb']:.1f} MB peak RSS"
+    if 'peak_traced_mb' in timings:
+        text += f", {timings['peak_traced_mb']:.1f} MB traced"
+    return text
+
+
+def compare(baseline, current, tolerance=0.10):
+    """Table of wall time per stage against a baseline run; `regressed` marks stages slower than 1 + tolerance."""
+    rows = []
+    for stage in STAGES:
+        if stage in baseline['stages'] and stage in current['stages']:
+            before, after = baseline['stages'][stage], current['stages'][stage]
+            ratio = after['wall_s'] / before['wall_s'] if before['wall_s'] > 0 else np.nan
+            rows.append({'stage': stage, 'baseline_s': before['wall_s'], 'current_s': after['wall_s'],
+                         'ratio': ratio, 'baseline_rows': before['rows'], 'current_rows': after['rows'],
+                         'regressed': bool(ratio > 1 + tolerance)})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time and memory-profile each stage of the analysis on a real or synthetic transaction CSV.")
+    parser.add_argument('data_path', nargs='?', help="Transaction CSV to benchmark (omit with --rows).")
+    parser.add_argument('--rows', help="Benchmark a synthetic file of this many rows (e.g. 1M, 10M, 100M), "
+                                       "generated by walmart_synth.py and reused if it already exists.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic file.")
+    parser.add_argument('--data-dir', default='.', help="Where synthetic files are written.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help="Stages to time (default: all). 'load' and 'types' are a default-dtype reference "
+                             "baseline; 'cached_load' leaves a <csv>.cache/ directory next to the file. "
+                             "Only 'stream' keeps memory bounded on 100M rows.")
+    parser.add_argument('--repeats', type=int, default=1, help="Timed runs per stage; the median is reported.")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the extra tracemalloc run per stage.")
+    parser.add_argument('--resamples', type=int, default=200, help="Bootstrap resamples.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for the bootstrap stage.")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="Rows per chunk in the stream stage.")
+    parser.add_argument('--output', default='benchmark.json', help="Machine-readable results (JSON).")
+    parser.add_argument('--compare', metavar='BASELINE', help="Compare against an earlier results file; "
+                                                              "exits with status 1 if a stage regressed.")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Allowed slowdown before a stage counts as regressed (default 0.10 = 10%%).")
+    args = parser.parse_args(argv)
+
+    if args.rows:
+        n_rows = parse_rows(args.rows)
+        path = args.data_path or os.path.join(args.data_dir, f"walmart_synth_{n_rows}_{args.seed}.csv")
+        if not os.path.exists(path):
+            print(f"Generating {n_rows:,} synthetic rows into {path}...")
+            write_csv(path, n_rows, seed=args.seed)
+    elif args.data_path:
+        path = args.data_path
+    else:
+        parser.error("give a data_path or --rows")
+    if not os.path.exists(path):
+        print(f"Error: The file {path} was not found.")
+        return 1
+
+    print(f"Benchmarking {path}")
+    stages = run_benchmark(path, stages=args.stages, repeats=args.repeats, trace_memory=not args.no_memory,
+                           n_resamples=args.resamples, workers=args.workers, chunksize=args.chunksize)
+    result = {'format_version': BENCHMARK_FORMAT_VERSION,
+              'meta': run_metadata(data_path=os.path.abspath(path), data_bytes=os.path.getsize(path),
+                                   repeats=args.repeats, resamples=args.resamples, workers=args.workers,
+                                   chunksize=args.chunksize, trace_memory=not args.no_memory),
+              'stages': stages}
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        table = compare(baseline, result, tolerance=args.tolerance)
+        print(f"\nWall time against {args.compare}:")
+        print(table.to_string(index=False, float_format='{:.3f}'.format))
+        if table['regressed'].any():
+            print(f"Regressed stages: {', '.join(table.loc[table['regressed'], 'stage'])}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
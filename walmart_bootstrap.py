@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from walmart_aggregate import encode
+
+# Upper bound on the number of resampled values materialised at once (int64 indices plus
+# gathered values), so memory stays bounded however large a segment is.
+MAX_BATCH_ELEMENTS = 1 << 22
+# Resamples per task. Every block has its own seed derived from (seed, segment, block), so
+# results are identical whatever the number of worker processes.
+BLOCK_SIZE = 250
+
+
+def _block_means(values, entropy, n_resamples, max_batch_elements=MAX_BATCH_ELEMENTS):
+    """Means of `n_resamples` bootstrap resamples of `values`, drawn in bounded batches."""
+    rng = np.random.default_rng(np.random.SeedSequence(entropy))
+    n = len(values)
+    batch = max(1, max_batch_elements // max(n, 1))
+    means = np.empty(n_resamples)
+    for start in range(0, n_resamples, batch):
+        stop = min(start + batch, n_resamples)
+        idx = rng.integers(0, n, size=(stop - start, n), dtype=np.int32 if n < 2 ** 31 else np.int64)
+        means[start:stop] = np.take(values, idx).mean(axis=1)
+    return means
+
+
+def _block_plan(n_resamples, block_size=BLOCK_SIZE):
+    sizes = [block_size] * (n_resamples // block_size)
+    if n_resamples % block_size:
+        sizes.append(n_resamples % block_size)
+    return sizes
+
+
+def bootstrap_means(segments, n_resamples=2000, seed=0, workers=1):
+    """Bootstrap distributions of the mean for several segments.
+
+    `segments` is a list of 1-D arrays. The resamples of every segment are split into blocks
+    that are spread over a process pool when workers > 1. Returns a list of arrays of
+    `n_resamples` resampled means, one per segment.
+    """
+    tasks = []
+    for s, values in enumerate(segments):
+        values = np.asarray(values, dtype=np.float64)
+        for b, size in enumerate(_block_plan(n_resamples)):
+            tasks.append((s, values, [seed, s, b], size))
+
+    results = [[] for _ in segments]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(s, pool.submit(_block_means, values, entropy, size)) for s, values, entropy, size in tasks]
+            for s, future in futures:
+                results[s].append(future.result())
+    else:
+        for s, values, entropy, size in tasks:
+            results[s].append(_block_means(values, entropy, size))
+    return [np.concatenate(blocks) if blocks else np.empty(0) for blocks in results]
+
+
+def percentile_interval(boot_means, confidence_levels):
+    """Percentile bootstrap intervals, one (lower, upper) row per confidence level."""
+    alpha = 1 - np.asarray(confidence_levels, dtype=np.float64)
+    lower = np.quantile(boot_means, alpha / 2)
+    upper = np.quantile(boot_means, 1 - alpha / 2)
+    return np.column_stack([lower, upper])
+
+
+def bca_interval(values, boot_means, confidence_levels):
+    """Bias-corrected and accelerated (BCa) bootstrap intervals for the mean.
+
+    For the mean, the jackknife estimates are (sum - x_i) / (n - 1), so the acceleration
+    has a closed form in the deviations x_i - mean and needs no n leave-one-out passes.
+    """
+    from scipy import special
+    values = np.asarray(values, dtype=np.float64)
+    theta = values.mean()
+    alpha = 1 - np.asarray(confidence_levels, dtype=np.float64)
+    dev = values - theta
+    denominator = 6 * np.sum(dev ** 2) ** 1.5
+    if len(values) < 2 or not denominator > 0:
+        # A single row or a constant segment: the degenerate interval (mean, mean), as in
+        # confidence_intervals(), instead of 0/0 in the acceleration
+        return np.full((len(alpha), 2), theta)
+    a = np.sum(dev ** 3) / denominator
+    # Bias correction: how far the bootstrap distribution's median is from the estimate. The
+    # proportion is kept off 0 and 1 so z0 stays finite when every resample falls on one side.
+    half = 0.5 / len(boot_means)
+    z0 = special.ndtri(np.clip(np.mean(boot_means < theta), half, 1 - half))
+
+    z = special.ndtri(np.column_stack([alpha / 2, 1 - alpha / 2]))
+    adjusted = special.ndtr(z0 + (z0 + z) / (1 - a * (z0 + z)))
+    return np.quantile(boot_means, np.clip(adjusted, 0.0, 1.0))
+
+
+def bootstrap_segments(df, dimensions, confidence_levels, method='percentile', n_resamples=2000,
+                       seed=0, workers=1, value_column='Purchase'):
+    """Bootstrap confidence intervals for the mean of every level of every dimension.
+
+    Returns a tidy table shaped like walmart_aggregate.confidence_intervals(): one row
+    per (dimension, level, confidence) with `lower` and `upper`, plus the `method` used.
+    """
+    if method not in ('percentile', 'bca'):
+        raise ValueError(f"Unknown bootstrap method: {method}")
+    values = df[value_column].to_numpy()
+    labels, segments = [], []
+    for dimension in dimensions:
+        codes, levels = encode(df[dimension])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(levels) + 1))
+        for k, level in enumerate(levels):
+            segment = values[order[bounds[k]:bounds[k + 1]]]
+            if len(segment):
+                labels.append((dimension, level))
+                segments.append(segment)
+
+    boot = bootstrap_means(segments, n_resamples=n_resamples, seed=seed, workers=workers)
+    rows = []
+    for (dimension, level), segment, boot_means in zip(labels, segments, boot):
+        if method == 'bca':
+            bounds = bca_interval(segment, boot_means, confidence_levels)
+        else:
+            bounds = percentile_interval(boot_means, confidence_levels)
+        for confidence, (lower, upper) in zip(confidence_levels, bounds):
+            rows.append({'dimension': dimension, 'level': level, 'count': len(segment),
+                         'mean': segment.mean(), 'confidence': confidence, 'method': method,
+                         'lower': lower, 'upper': upper})
+    return pd.DataFrame(rows)
+
+
+def ci_width_curve(values, sample_sizes, confidence=0.95, n_repeats=200, seed=0,
+                   max_batch_elements=MAX_BATCH_ELEMENTS):
+    """CLT confidence-interval width as a function of sample size.
+
+    For each size, `n_repeats` random samples (drawn with replacement) are taken as one
+    batch of index rows, and the CI width 2 * z * std / sqrt(n) is computed
+    for all of them at once. Returns one row per size with the mean and spread of the
+    observed widths and the theoretical width from the full data's standard deviation.
+    """
+    from scipy import special
+    values = np.asarray(values, dtype=np.float64)
+    z = special.ndtri((1 + confidence) / 2)
+    sigma = values.std(ddof=1)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for size in sample_sizes:
+        if size > len(values) or size < 2:
+            continue
+        batch = max(1, max_batch_elements // size)
+        widths = np.empty(n_repeats)
+        for start in range(0, n_repeats, batch):
+            stop = min(start + batch, n_repeats)
+            idx = rng.integers(0, len(values), size=(stop - start, size))
+            widths[start:stop] = 2 * z * values[idx].std(axis=1, ddof=1) / np.sqrt(size)
+        rows.append({'sample_size': size, 'mean_width': widths.mean(), 'width_std': widths.std(ddof=1),
+                     'theoretical_width': 2 * z * sigma / np.sqrt(size)})
+    return pd.DataFrame(rows)
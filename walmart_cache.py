@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout or the cleaning applied before caching changes,
+# so older caches are rebuilt instead of being read with the wrong meaning.
+CACHE_FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+def cache_dir_for(path):
+    """The cache for `walmart_data.csv` lives next to it in `walmart_data.csv.cache/`."""
+    return f"{path}.cache"
+
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 of the file contents, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path, with_hash=True):
+    """Size, modification time and (optionally) content hash of the source file."""
+    st = os.stat(path)
+    fingerprint = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if with_hash:
+        fingerprint['sha256'] = file_hash(path)
+    return fingerprint
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def is_cache_valid(path, manifest, verify_hash=False):
+    """A cache is valid when it was written from a file with the same size and mtime
+    (and, with verify_hash, the same content hash) by the current cache format."""
+    if manifest is None or manifest.get('format_version') != CACHE_FORMAT_VERSION:
+        return False
+    cached = manifest['source']
+    current = source_fingerprint(path, with_hash=verify_hash)
+    if cached['size'] != current['size'] or cached['mtime_ns'] != current['mtime_ns']:
+        return False
+    return not verify_hash or cached['sha256'] == current['sha256']
+
+
+def write_cache(df, path, fingerprint=None):
+    """Write a cleaned, typed frame as one .npy file per column plus a JSON manifest.
+
+    Categorical columns are stored as their integer codes with the categories in the manifest,
+    so reloading them does not re-create any strings. The manifest is written last: a partially
+    written cache has no manifest and is treated as missing. Pass the `fingerprint` taken before
+    the source was parsed so a file modified mid-parse is not recorded as up to date.
+    """
+    cache_dir = cache_dir_for(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    columns = []
+    for i, (name, column) in enumerate(df.items()):
+        file_name = f"{i:03d}.npy"
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(cache_dir, file_name), column.cat.codes.to_numpy())
+            columns.append({'name': name, 'file': file_name, 'kind': 'category',
+                            'categories': column.cat.categories.tolist(),
+                            'ordered': bool(column.cat.ordered)})
+        else:
+            np.save(os.path.join(cache_dir, file_name), column.to_numpy())
+            columns.append({'name': name, 'file': file_name, 'kind': 'array'})
+
+    manifest = {'format_version': CACHE_FORMAT_VERSION,
+                'source': fingerprint or source_fingerprint(path),
+                'rows': len(df),
+                'columns': columns}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+
+def read_cache(path, manifest):
+    """Load the cached frame. Column arrays are memory-mapped rather than read and parsed."""
+    cache_dir = cache_dir_for(path)
+    data = {}
+    for column in manifest['columns']:
+        values = np.load(os.path.join(cache_dir, column['file']), mmap_mode='r')
+        if column['kind'] == 'category':
+            dtype = pd.CategoricalDtype(column['categories'], ordered=column['ordered'])
+            data[column['name']] = pd.Categorical.from_codes(values, dtype=dtype)
+        else:
+            data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def load_cached(path, build, verify_hash=False):
+    """Return the frame for `path` from its cache, rebuilding the cache with `build(path)` when
+    the source file's size, mtime (or, with verify_hash, content hash) no longer match.
+
+    Returns (df, cache_hit).
+    """
+    manifest = _read_manifest(cache_dir_for(path))
+    if is_cache_valid(path, manifest, verify_hash=verify_hash):
+        return read_cache(path, manifest), True
+    fingerprint = source_fingerprint(path)
+    df = build(path)
+    write_cache(df, path, fingerprint)
+    return df, False
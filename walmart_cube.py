@@ -0,0 +1,271 @@
+import numpy as np
+import pandas as pd
+
+from walmart_loader import (AGE_GROUP_ORDER, CITY_CATEGORIES, GENDER_CATEGORIES, MARITAL_CATEGORIES,
+                            OCCUPATION_CATEGORIES, STAY_CATEGORIES)
+
+# Dimensions of the segment cube and their declared levels. Fixed levels give every cube
+# the same shape, so cubes built from different chunks or files can simply be added together.
+CUBE_LEVELS = {
+    'Gender': GENDER_CATEGORIES,
+    'Age_Group': AGE_GROUP_ORDER,
+    'Occupation': OCCUPATION_CATEGORIES,
+    'City_Category': CITY_CATEGORIES,
+    'Marital_Status': MARITAL_CATEGORIES,
+    'Stay_In_Current_City_Years': STAY_CATEGORIES,
+}
+CUBE_DIMENSIONS = list(CUBE_LEVELS)
+
+
+def _codes(column, levels):
+    if isinstance(column.dtype, pd.CategoricalDtype) and list(column.cat.categories) == list(levels):
+        return column.cat.codes.to_numpy().astype(np.int64)
+    return pd.Categorical(column, categories=levels).codes.astype(np.int64)
+
+
+class SegmentCube:
+    """Dense count / sum / sum-of-squares arrays of Purchase over every combination of the cube dimensions.
+
+    Sums are kept relative to a fixed `shift` (close to the overall mean) so variances
+    derived from them do not suffer from cancellation. Because the arrays are plain sums,
+    rolling up to any subset of dimensions is a sum over the other axes, and two cubes
+    merge exactly by adding their arrays.
+    """
+
+    def __init__(self, dimensions=CUBE_DIMENSIONS, shift=None):
+        self.dimensions = list(dimensions)
+        self.levels = [list(CUBE_LEVELS[dimension]) for dimension in self.dimensions]
+        shape = tuple(len(levels) for levels in self.levels)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.total = np.zeros(shape, dtype=np.float64)
+        self.total_sq = np.zeros(shape, dtype=np.float64)
+        self.shift = shift
+        # Rows whose value for some dimension is missing or not a declared level
+        self.unmatched = 0
+
+    def update(self, df, value_column='Purchase'):
+        """Fold the rows of a DataFrame into the cube with one bincount pass per moment."""
+        shape = self.count.shape
+        flat = np.zeros(len(df), dtype=np.int64)
+        valid = np.ones(len(df), dtype=bool)
+        for dimension, levels, size in zip(self.dimensions, self.levels, shape):
+            codes = _codes(df[dimension], levels)
+            valid &= codes >= 0
+            flat = flat * size + codes
+        values = df[value_column].to_numpy().astype(np.float64)
+        self.unmatched += int((~valid).sum())
+        flat, values = flat[valid], values[valid]
+        if self.shift is None:
+            self.shift = float(values.mean()) if len(values) else 0.0
+        shifted = values - self.shift
+        size = self.count.size
+        self.count += np.bincount(flat, minlength=size).reshape(shape)
+        self.total += np.bincount(flat, weights=shifted, minlength=size).reshape(shape)
+        self.total_sq += np.bincount(flat, weights=shifted * shifted, minlength=size).reshape(shape)
+        return self
+
+    def merge(self, other):
+        """Add another cube over the same dimensions, re-centring its sums onto this cube's shift."""
+        if other.dimensions != self.dimensions:
+            raise ValueError(f"Cannot merge cubes over {other.dimensions} into {self.dimensions}")
+        if other.shift is None:
+            return self
+        if self.shift is None:
+            self.shift = other.shift
+        d = other.shift - self.shift
+        self.count += other.count
+        self.total += other.total + d * other.count
+        self.total_sq += other.total_sq + 2 * d * other.total + d * d * other.count
+        self.unmatched += other.unmatched
+        return self
+
+    def to_dict(self):
+        return {'dimensions': self.dimensions, 'shift': self.shift, 'unmatched': self.unmatched,
+                'count': self.count.tolist(), 'total': self.total.tolist(), 'total_sq': self.total_sq.tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        cube = cls(state['dimensions'], state['shift'])
+        cube.unmatched = state['unmatched']
+        cube.count = np.asarray(state['count'], dtype=np.int64).reshape(cube.count.shape)
+        cube.total = np.asarray(state['total'], dtype=np.float64).reshape(cube.total.shape)
+        cube.total_sq = np.asarray(state['total_sq'], dtype=np.float64).reshape(cube.total_sq.shape)
+        return cube
+
+    def rollup(self, dimensions):
+        """Tidy table with one row per populated combination of `dimensions`.
+
+        Columns are the dimensions followed by count, mean, var, std and sem.
+        An empty list rolls everything up into a single overall row.
+        """
+        unknown = [dimension for dimension in dimensions if dimension not in self.dimensions]
+        if unknown:
+            raise KeyError(f"Not cube dimensions: {unknown}")
+        keep = [self.dimensions.index(dimension) for dimension in dimensions]
+        drop = tuple(axis for axis in range(len(self.dimensions)) if axis not in keep)
+        count = self.count.sum(axis=drop)
+        total = self.total.sum(axis=drop)
+        total_sq = self.total_sq.sum(axis=drop)
+        # The remaining axes follow cube order; put them in the requested order.
+        order = [sorted(keep).index(axis) for axis in keep]
+        count, total, total_sq = (np.transpose(a, order) if a.ndim > 1 else a for a in (count, total, total_sq))
+        count, total, total_sq = count.ravel(), total.ravel(), total_sq.ravel()
+
+        index = pd.MultiIndex.from_product([self.levels[axis] for axis in keep], names=dimensions) \
+            if dimensions else pd.RangeIndex(1)
+        shift = self.shift or 0.0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            var = np.where(count > 1, np.maximum(total_sq - total * mean, 0.0) / (count - 1), np.nan)
+            std = np.sqrt(var)
+            sem = std / np.sqrt(count)
+        table = pd.DataFrame({'count': count, 'mean': mean + shift, 'var': var, 'std': std, 'sem': sem}, index=index)
+        table = table[table['count'] > 0]
+        return table.reset_index() if dimensions else table.reset_index(drop=True)
+
+
+def adjust_p_values(p_values, method='holm'):
+    """Multiple-comparison adjusted p-values ('bonferroni', 'holm' or Benjamini-Hochberg 'fdr_bh')."""
+    p = np.asarray(p_values, dtype=np.float64)
+    m = len(p)
+    if m == 0:
+        return p
+    if method == 'bonferroni':
+        return np.minimum(p * m, 1.0)
+    order = np.argsort(p)
+    ranked = p[order]
+    if method == 'holm':
+        adjusted = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    elif method == 'fdr_bh':
+        adjusted = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"Unknown correction method: {method}")
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+def pairwise_tests(segments, confidence=0.95, correction='holm', min_count=30):
+    """Welch t-tests and CI-overlap checks between every pair of segments, vectorized over all pairs.
+
+    `segments` is a table with count, mean and sem columns (a cube roll-up or an aggregate() summary).
+    Segments with fewer than `min_count` rows are left out, as the CLT interval is unreliable there.
+    Returns one row per pair: the positions `a` and `b` of the two segments in `segments`, the mean
+    difference, Welch's t and degrees of freedom, the raw and adjusted p-values, whether the
+    difference is significant after correction, and whether the two CLT intervals overlap.
+    """
+    positions, n, mean, sem = _eligible(segments, min_count)
+    i, j = np.triu_indices(len(n), k=1)
+    diff, t, dof, p, overlap = _welch_pairs(n, mean, sem, i, j, confidence)
+    p_adjusted = adjust_p_values(p, correction)
+    return pd.DataFrame({'a': positions[i], 'b': positions[j], 'diff': diff, 't': t, 'dof': dof,
+                         'p_value': p, 'p_adjusted': p_adjusted,
+                         'significant': p_adjusted < 1 - confidence, 'ci_overlap': overlap})
+
+
+def _eligible(segments, min_count):
+    eligible = (segments['count'] >= min_count).to_numpy()
+    return (np.flatnonzero(eligible), segments['count'].to_numpy()[eligible].astype(np.float64),
+            segments['mean'].to_numpy()[eligible], segments['sem'].to_numpy()[eligible])
+
+
+def _welch_pairs(n, mean, sem, i, j, confidence):
+    """Mean difference, Welch's t, degrees of freedom, two-sided p-value and CI overlap of pairs (i, j)."""
+    from scipy import special
+    var_i, var_j = sem[i] ** 2, sem[j] ** 2
+    diff = mean[i] - mean[j]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        se = np.sqrt(var_i + var_j)
+        t = diff / se
+        # Welch-Satterthwaite degrees of freedom
+        dof = (var_i + var_j) ** 2 / (var_i ** 2 / (n[i] - 1) + var_j ** 2 / (n[j] - 1))
+    # Two-sided p-value from Student's t CDF (what stats.t.sf evaluates)
+    p = 2 * special.stdtr(dof, -np.abs(t))
+
+    z = special.ndtri((1 + confidence) / 2)
+    lower, upper = mean - z * sem, mean + z * sem
+    overlap = (lower[i] < upper[j]) & (lower[j] < upper[i])
+    return diff, t, dof, p, overlap
+
+
+def _pair_blocks(n_segments, block_pairs):
+    """(i, j) index arrays of the upper triangle, a band of rows at a time with about `block_pairs` pairs each."""
+    start = 0
+    while start < n_segments - 1:
+        stop, size = start + 1, n_segments - 1 - start
+        while stop < n_segments - 1 and size + n_segments - 1 - stop <= block_pairs:
+            size += n_segments - 1 - stop
+            stop += 1
+        rows = np.arange(start, stop)
+        row_pairs = n_segments - 1 - rows
+        i = np.repeat(rows, row_pairs)
+        # Position within the row: j runs from i + 1 to n_segments - 1
+        offset = np.arange(size) - np.repeat(np.cumsum(row_pairs) - row_pairs, row_pairs)
+        yield i, i + 1 + offset
+        start = stop
+
+
+def count_significant(p_values, method='holm', alpha=0.05, block_size=1 << 20):
+    """Number of p-values below `alpha` after adjust_p_values(), without building the adjusted vector.
+
+    Holm and Benjamini-Hochberg both reject a prefix of the sorted p-values, so only the
+    length of that prefix is needed; it is found block by block. Sorts `p_values` in place.
+    """
+    if method not in ('bonferroni', 'holm', 'fdr_bh'):
+        raise ValueError(f"Unknown correction method: {method}")
+    p = p_values
+    p.sort()
+    m = len(p)
+    significant = 0
+    for start in range(0, m, block_size):
+        block = p[start:start + block_size]
+        rank = np.arange(start + 1, start + len(block) + 1)
+        with np.errstate(invalid='ignore'):
+            if method == 'bonferroni':
+                significant += int((block * m < alpha).sum())
+            elif method == 'holm':
+                # Step-down: reject while (m - k + 1) * p_(k) < alpha, stop at the first failure
+                failed = np.flatnonzero(~(block * (m - rank + 1) < alpha))
+                if len(failed):
+                    return start + int(failed[0])
+                significant = start + len(block)
+            else:
+                # Step-up: reject everything up to the largest k with p_(k) * m / k < alpha
+                passed = np.flatnonzero(block * m / rank < alpha)
+                if len(passed):
+                    significant = start + int(passed[-1]) + 1
+    return significant
+
+
+def pairwise_summary(segments, confidence=0.95, correction='holm', min_count=30, block_pairs=1 << 18):
+    """Totals of pairwise_tests() without materializing one row per pair.
+
+    The upper triangle of pairs is processed in bands of about `block_pairs` pairs; only
+    the p-values are kept (the multiple-comparison correction needs all of them), and the
+    significant and overlapping pairs are counted from them. A fully populated six-dimension
+    cube has ~20M pairs, so this is what keeps the cube tests within bounded memory.
+    Returns {'segments': segments compared, 'pairs', 'significant', 'ci_overlap'}.
+    """
+    _, n, mean, sem = _eligible(segments, min_count)
+    n_pairs = len(n) * (len(n) - 1) // 2
+    p_values = np.empty(n_pairs)
+    overlapping, filled = 0, 0
+    for i, j in _pair_blocks(len(n), block_pairs):
+        _, _, _, p, overlap = _welch_pairs(n, mean, sem, i, j, confidence)
+        p_values[filled:filled + len(p)] = p
+        filled += len(p)
+        overlapping += int(overlap.sum())
+    return {'segments': len(n) if n_pairs else 0, 'pairs': n_pairs,
+            'significant': count_significant(p_values, correction, 1 - confidence), 'ci_overlap': overlapping}
+
+
+def pairwise_matrix(pairs, segments, column='p_adjusted', labels=None):
+    """Square matrix view of one column of pairwise_tests() output, labelled by segment."""
+    if labels is None:
+        labels = [' / '.join(str(value) for value in row) for row in
+                  segments.drop(columns=['count', 'mean', 'var', 'std', 'sem'], errors='ignore').itertuples(index=False)]
+    n = len(segments)
+    matrix = np.full((n, n), np.nan if pairs[column].dtype.kind == 'f' else False, dtype=pairs[column].dtype)
+    matrix[pairs['a'], pairs['b']] = pairs[column]
+    matrix[pairs['b'], pairs['a']] = pairs[column]
+    return pd.DataFrame(matrix, index=labels, columns=labels)
@@ -0,0 +1,249 @@
+import cProfile
+import datetime
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+TIMINGS_FORMAT_VERSION = 1
+
+
+def cpu_seconds():
+    """User + system CPU of this process and its finished children (pool workers)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def max_rss_mb():
+    """High-water mark of this process' resident memory since it started."""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1 << 20) if sys.platform == 'darwin' else max_rss / (1 << 10)
+
+
+def peak_rss_mb():
+    """Linux' resettable resident-memory high-water mark (VmHWM), or None where there is no /proc."""
+    try:
+        with open('/proc/self/status') as f:
+            match = re.search(r'^VmHWM:\s+(\d+) kB', f.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) / (1 << 10) if match else None
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS (writing 5 to clear_refs). Returns False where that is not possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(**settings):
+    """What a run was measured on, so results from different machines and commits can be told apart."""
+    return {'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': git_commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'argv': sys.argv, 'settings': settings}
+
+
+class StageRecord:
+    """Measurements of one instrumented stage. Set `rows` inside the block when it is only known there."""
+
+    def __init__(self, name, depth, rows=None):
+        self.name = name
+        self.depth = depth
+        self.rows = rows
+        self.wall_s = None
+        self.cpu_s = None
+        self.peak_rss_mb = None
+        self.peak_traced_mb = None
+        self.max_rss_mb = None
+        self.profile = None
+        self.error = None
+
+    def to_dict(self):
+        rows_per_s = self.rows / self.wall_s if self.rows and self.wall_s else None
+        return {'stage': self.name, 'depth': self.depth, 'wall_s': self.wall_s, 'cpu_s': self.cpu_s,
+                'rows': self.rows, 'rows_per_s': rows_per_s, 'peak_rss_mb': self.peak_rss_mb,
+                'peak_traced_mb': self.peak_traced_mb, 'max_rss_mb': self.max_rss_mb,
+                'profile': self.profile, 'error': self.error}
+
+
+class _NullStage:
+    """What stage() returns while instrumentation is off: one shared, do-nothing context manager."""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        # `record.rows = n` inside a disabled stage is a no-op
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, instrumentation, name, rows):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        inst = self.instrumentation
+        parent = inst._stack[-1] if inst._stack else None
+        name = f"{parent.record.name}/{self.name}" if parent else self.name
+        self.record = StageRecord(name, len(inst._stack), self.rows)
+        inst.records.append(self.record)
+        # Peaks are reset for every stage; the enclosing stage keeps the highest peak seen so far
+        # so nested stages do not hide its own high-water mark.
+        if parent:
+            parent._fold_peaks()
+        self._rss_peak, self._traced_peak = 0.0, 0.0
+        inst._reset_peaks()
+        inst._stack.append(self)
+        # cProfile cannot nest, so only top-level stages get a profile
+        self.profiler = None
+        if inst.profile_dir and self.record.depth == 0:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.wall_start, self.cpu_start = time.perf_counter(), cpu_seconds()
+        return self.record
+
+    def __exit__(self, exc_type, exc, traceback):
+        record = self.record
+        record.wall_s = time.perf_counter() - self.wall_start
+        record.cpu_s = cpu_seconds() - self.cpu_start
+        inst = self.instrumentation
+        if self.profiler is not None:
+            self.profiler.disable()
+            index = sum(1 for other in inst.records if other.depth == 0)
+            record.profile = os.path.join(inst.profile_dir, f"{index:02d}_{record.name}.prof")
+            self.profiler.dump_stats(record.profile)
+        self._fold_peaks()
+        if inst.peak_rss_resettable:
+            record.peak_rss_mb = self._rss_peak
+        if tracemalloc.is_tracing():
+            record.peak_traced_mb = self._traced_peak
+        record.max_rss_mb = max_rss_mb()
+        if exc_type is not None:
+            record.error = exc_type.__name__
+        inst._stack.pop()
+        if inst._stack:
+            parent = inst._stack[-1]
+            parent._rss_peak = max(parent._rss_peak, self._rss_peak)
+            parent._traced_peak = max(parent._traced_peak, self._traced_peak)
+        return False
+
+    def _fold_peaks(self):
+        rss_peak = peak_rss_mb()
+        if rss_peak is not None:
+            self._rss_peak = max(self._rss_peak, rss_peak)
+        if tracemalloc.is_tracing():
+            self._traced_peak = max(self._traced_peak, tracemalloc.get_traced_memory()[1] / (1 << 20))
+
+
+class Instrumentation:
+    """Per-stage wall time, CPU time, peak memory and throughput of one run.
+
+    Stages are `with instrumentation.stage(name, rows=...)` blocks and may nest; nested stage
+    names are joined with '/'. CPU time includes finished worker processes. Peak RSS is
+    per stage on Linux (the kernel's high-water mark is reset at every stage boundary) and
+    None elsewhere, where only the process-wide `max_rss_mb` is available. With
+    `trace_memory`, tracemalloc also reports the peak of Python and numpy/pandas allocations
+    in this process (not in workers), at a noticeable cost in speed. With `profile_dir`, every
+    top-level stage is run under cProfile and dumped to `<profile_dir>/<nn>_<stage>.prof`.
+    """
+
+    def __init__(self, trace_memory=False, profile_dir=None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.records = []
+        self._stack = []
+        self.peak_rss_resettable = reset_peak_rss()
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def _reset_peaks(self):
+        if self.peak_rss_resettable:
+            reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def stage(self, name, rows=None):
+        return _Stage(self, name, rows)
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def table(self):
+        """One row per stage, in the order the stages started."""
+        return pd.DataFrame([record.to_dict() for record in self.records])
+
+    def report(self, **settings):
+        return {'format_version': TIMINGS_FORMAT_VERSION,
+                'meta': run_metadata(trace_memory=self.trace_memory, profile_dir=self.profile_dir, **settings),
+                'stages': [record.to_dict() for record in self.records]}
+
+    def save(self, path, **settings):
+        """Write the JSON timing report."""
+        with open(path, 'w') as f:
+            json.dump(self.report(**settings), f, indent=2)
+        return path
+
+
+_active = None
+
+
+def activate(instrumentation):
+    """Route stage() to `instrumentation` (started) until deactivate(). Returns it."""
+    global _active
+    _active = instrumentation.start()
+    return instrumentation
+
+
+def deactivate():
+    global _active
+    if _active is not None:
+        _active.stop()
+    _active = None
+
+
+def stage(name, rows=None):
+    """Instrument a block as a stage of the active Instrumentation: `with stage('load') as record:`.
+
+    With no active Instrumentation this returns a shared no-op context manager, so the hooks
+    cost a global lookup and a with-statement and can stay in production code.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name, rows)
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+# Declared categories for the demographic columns. Knowing them up front lets read_csv
+# build int8 category codes while parsing instead of materialising Python strings first.
+GENDER_CATEGORIES = ['F', 'M']
+AGE_CATEGORIES = ['0-17', '18-25', '26-35', '36-45', '46-50', '51-55', '55+']
+CITY_CATEGORIES = ['A', 'B', 'C']
+STAY_CATEGORIES = ['0', '1', '2', '3', '4+']
+MARITAL_CATEGORIES = [0, 1]
+# Occupation is a masked code; the exports use 0-20.
+OCCUPATION_CATEGORIES = list(range(21))
+
+AGE_GROUP_ORDER = ['0-17', '18-25', '26-35', '36-50', '51+']
+# Age -> Age_Group, the same bins as map_age_to_group() in walmart_analysis.py
+AGE_TO_AGE_GROUP = {
+    '0-17': '0-17',
+    '18-25': '18-25',
+    '26-35': '26-35',
+    '36-45': '36-50',
+    '46-50': '36-50',
+    '51-55': '51+',
+    '55+': '51+',
+}
+# Age code -> Age_Group code. The trailing -1 maps missing/unknown ages (code -1) to NaN.
+AGE_CODE_TO_GROUP_CODE = np.array(
+    [AGE_GROUP_ORDER.index(AGE_TO_AGE_GROUP[age]) for age in AGE_CATEGORIES] + [-1], dtype=np.int8)
+
+# Schema applied at parse time. Columns missing from a given export are simply ignored by read_csv.
+# Purchase, Occupation and Product_Category are parsed as floats, which read_csv fills much faster than
+# nullable integers and which tolerate blank cells; the cleaning step narrows them once blanks are handled.
+SCHEMA = {
+    'User_ID': 'category',
+    'Product_ID': 'category',
+    'Gender': pd.CategoricalDtype(GENDER_CATEGORIES),
+    'Age': pd.CategoricalDtype(AGE_CATEGORIES, ordered=True),
+    'Occupation': np.float32,
+    'City_Category': pd.CategoricalDtype(CITY_CATEGORIES),
+    'Stay_In_Current_City_Years': pd.CategoricalDtype(STAY_CATEGORIES, ordered=True),
+    'Marital_Status': pd.CategoricalDtype(MARITAL_CATEGORIES),
+    'Product_Category': np.float32,
+    'Product_Category_2': np.float32,
+    'Product_Category_3': np.float32,
+    'Purchase': np.float64,
+}
+
+CODE_COLUMNS = ['Occupation', 'Product_Category']
+
+# Chunks of a streamed file are read without the ID columns' dictionaries,
+# since every chunk would build its own (incompatible) set of categories.
+STREAM_SCHEMA = {column: dtype for column, dtype in SCHEMA.items() if column not in ('User_ID', 'Product_ID')}
+
+
+def add_age_group(df):
+    """Add the ordered Age_Group column by remapping Age category codes (no per-row Python calls)."""
+    codes = AGE_CODE_TO_GROUP_CODE[df['Age'].cat.codes.to_numpy()]
+    df['Age_Group'] = pd.Categorical.from_codes(codes, categories=AGE_GROUP_ORDER, ordered=True)
+    return df
+
+
+def compact_purchase(df):
+    """Store Purchase as int32 once missing values have been dropped (it is parsed as float64)."""
+    df['Purchase'] = df['Purchase'].astype(np.int32)
+    return df
+
+
+def compact_codes(df):
+    """Store Occupation and Product_Category as int8 when they have no blank cells.
+
+    Columns with blanks stay float32 with NaN, which the grouped statistics and the
+    segment cube skip like any other missing level, instead of aborting the load.
+    """
+    for column in CODE_COLUMNS:
+        if column in df.columns and not df[column].isna().any():
+            df[column] = df[column].astype(np.int8)
+    return df
+
+
+def load_typed(path, **read_csv_kwargs):
+    """Read the transaction CSV with the declared schema applied while parsing.
+
+    Demographic columns arrive as categoricals with int8 codes, User_ID and Product_ID
+    as dictionary-encoded categoricals (integer codes plus a lookup table in .cat.categories),
+    and the numeric columns as floats (see SCHEMA); compact_purchase() and compact_codes()
+    narrow them to integers after cleaning.
+    """
+    return pd.read_csv(path, dtype=SCHEMA, **read_csv_kwargs)
+
+
+def prepare_chunk(chunk):
+    """Cleaning applied to every streamed chunk (mirrors the in-memory cleaning in walmart_analysis.py)."""
+    chunk = chunk.dropna(subset=['Purchase'])
+    return add_age_group(compact_codes(chunk))
+
+
+def prepare_frame(path):
+    """Load and clean the whole table in one go; this is what --cache stores on disk."""
+    return compact_purchase(prepare_chunk(load_typed(path)))
@@ -0,0 +1,203 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from walmart_aggregate import encode, group_counts
+
+# Outliers drawn per box. A 500k-row segment can have tens of thousands of fliers;
+# a random sample (plus the extremes) looks the same and keeps the summaries small.
+MAX_FLIERS = 1000
+# Grid resolution for the binned KDE
+KDE_GRID_POINTS = 1024
+
+
+def histogram_summary(values, bins=50, grid_points=KDE_GRID_POINTS):
+    """Histogram counts plus a Gaussian KDE (Scott's bandwidth, as scipy/seaborn use) scaled to counts.
+
+    The KDE is computed on a binned grid: the data is histogrammed once onto `grid_points`
+    fine bins and convolved with the kernel, instead of evaluating every point at every grid position.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    counts, edges = np.histogram(values, bins=bins)
+    lo, hi = values.min(), values.max()
+    fine_counts, fine_edges = np.histogram(values, bins=grid_points, range=(lo, hi))
+    grid = (fine_edges[:-1] + fine_edges[1:]) / 2
+    step = fine_edges[1] - fine_edges[0]
+    bandwidth = values.std(ddof=1) * len(values) ** (-1 / 5) if len(values) > 1 else 0.0
+    # A single row or a constant column has no spread to smooth over (std is NaN or 0)
+    half_width = int(np.ceil(4 * bandwidth / step)) if step > 0 and bandwidth > 0 else 0
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) if half_width else np.ones(1)
+    kernel /= kernel.sum()
+    # On small inputs the kernel can be wider than the grid, and mode='same' would then return
+    # the kernel's length; take the grid-aligned middle of the full convolution instead.
+    density = np.convolve(fine_counts, kernel)[half_width:half_width + grid_points] / (len(values) * step)
+    # Same scale as the bars: expected count per histogram bin
+    kde = density * len(values) * (edges[1] - edges[0])
+    return {'counts': counts, 'edges': edges, 'grid': grid, 'kde': kde}
+
+
+def box_summary(values, label, max_fliers=MAX_FLIERS, rng=None):
+    """Box plot statistics in the form matplotlib's Axes.bxp() expects (1.5 * IQR whiskers)."""
+    values = np.asarray(values)
+    q1, med, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    inside = values[(values >= low) & (values <= high)]
+    fliers = values[(values < low) | (values > high)]
+    if len(fliers) > max_fliers:
+        rng = rng or np.random.default_rng(0)
+        sample = rng.choice(fliers, max_fliers - 2, replace=False)
+        fliers = np.concatenate([[fliers.min(), fliers.max()], sample])
+    return {'label': label, 'med': med, 'q1': q1, 'q3': q3,
+            'whislo': inside.min() if len(inside) else q1, 'whishi': inside.max() if len(inside) else q3,
+            'fliers': fliers, 'mean': values.mean()}
+
+
+def segment_box_summaries(df, dimension, order=None, value_column='Purchase'):
+    """Box statistics for every level of `dimension`, from one argsort of its codes."""
+    codes, levels = encode(df[dimension])
+    values = df[value_column].to_numpy()
+    sort = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[sort], np.arange(len(levels) + 1))
+    boxes = {}
+    for k, level in enumerate(levels):
+        segment = values[sort[bounds[k]:bounds[k + 1]]]
+        if len(segment):
+            boxes[level] = box_summary(segment, str(level))
+    order = order if order is not None else list(boxes)
+    return [boxes[level] for level in order if level in boxes]
+
+
+def sketch_histogram_summary(sketch, bins=50):
+    """Histogram counts estimated from a quantile sketch's CDF (no KDE without the raw values)."""
+    if sketch.count == 0:
+        # A file or segment without rows: an empty histogram rather than NaN edges
+        return {'counts': np.zeros(bins), 'edges': np.linspace(0.0, 1.0, bins + 1), 'grid': None, 'kde': None}
+    edges = np.linspace(sketch.min, sketch.max, bins + 1)
+    cdf = sketch.rank(edges)
+    cdf[0], cdf[-1] = 0.0, 1.0
+    return {'counts': np.diff(cdf) * sketch.count, 'edges': edges, 'grid': None, 'kde': None}
+
+
+def sketch_box_summary(sketch, label):
+    """Box statistics from a quantile sketch (walmart_sketch.KLLSketch).
+
+    Quartiles come from the sketch; whiskers are the most extreme retained items inside
+    1.5 * IQR, and the retained items outside them (plus the exact min and max) stand in
+    for the outliers.
+    """
+    q1, med, q3 = sketch.quantile([0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    items, _ = sketch.retained()
+    items = np.concatenate([items, [sketch.min, sketch.max]])
+    inside = items[(items >= low) & (items <= high)]
+    fliers = np.unique(items[(items < low) | (items > high)])
+    return {'label': label, 'med': med, 'q1': q1, 'q3': q3,
+            'whislo': inside.min() if len(inside) else q1, 'whishi': inside.max() if len(inside) else q3,
+            'fliers': fliers}
+
+
+def _distribution_figure(data):
+    return {'kind': 'hist', 'filename': 'purchase_distribution.png', 'figsize': (10, 6),
+            'title': 'Distribution of Purchase Amount', 'xlabel': 'Purchase Amount', 'ylabel': 'Frequency',
+            'data': data}
+
+
+def _box_figure(dimension, filename, title, xlabel, boxes):
+    return {'kind': 'box', 'filename': filename, 'figsize': (10, 6) if dimension == 'Age_Group' else (8, 6),
+            'title': title, 'xlabel': xlabel, 'ylabel': 'Purchase Amount', 'data': boxes}
+
+
+def _count_figures(summary, count_features):
+    figures = []
+    for feature in count_features:
+        counts = group_counts(summary, feature).sort_values(ascending=False)
+        figures.append({'kind': 'bar', 'filename': f'{feature}_countplot.png', 'figsize': (8, 5),
+                        'title': f'Count Plot for {feature}', 'xlabel': feature, 'ylabel': 'Count',
+                        'data': {'labels': [str(level) for level in counts.index], 'values': counts.to_numpy(),
+                                 'rotation': 45 if len(counts) > 5 else 0}})
+    return figures
+
+
+def eda_figures(df, summary, box_specs, count_features):
+    """Specs (summaries only, no raw rows) for the EDA figures.
+
+    `box_specs` is a list of (dimension, order, filename, title, xlabel); count plots read
+    their counts from the aggregate() `summary` table.
+    """
+    figures = [_distribution_figure(histogram_summary(df['Purchase'].to_numpy()))]
+    figures += _count_figures(summary, count_features)
+    for dimension, order, filename, title, xlabel in box_specs:
+        figures.append(_box_figure(dimension, filename, title, xlabel, segment_box_summaries(df, dimension, order)))
+    return figures
+
+
+def sketch_figures(sketches, summary, box_specs, count_features):
+    """The same figures as eda_figures(), built from streamed SegmentSketches instead of the raw rows."""
+    figures = [_distribution_figure(sketch_histogram_summary(sketches.overall))]
+    figures += _count_figures(summary, count_features)
+    for dimension, order, filename, title, xlabel in box_specs:
+        segment = sketches.segments[dimension]
+        order = order if order is not None else list(segment)
+        boxes = [sketch_box_summary(segment[level], str(level)) for level in order if level in segment]
+        figures.append(_box_figure(dimension, filename, title, xlabel, boxes))
+    return figures
+
+
+def ci_width_figure(width_curve):
+    """Spec for the CI-width-vs-sample-size curve (walmart_bootstrap.ci_width_curve() output)."""
+    return {'kind': 'curve', 'filename': 'ci_width_vs_sample_size.png', 'figsize': (8, 5),
+            'title': '95% CI Width vs. Sample Size (Male Purchases)', 'xlabel': 'Sample Size', 'ylabel': 'CI Width',
+            'data': {'x': width_curve['sample_size'].to_numpy(), 'xscale': 'log',
+                     'lines': [(width_curve['mean_width'].to_numpy(), 'Observed (mean of 200 samples)', '-', 'o'),
+                               (width_curve['theoretical_width'].to_numpy(), '2 * z * sigma / sqrt(n)', '--', None)]}}
+
+
+def render_figure(spec):
+    """Draw one figure from its precomputed summary on the headless Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    sns.set(style="whitegrid")
+    color = sns.color_palette()[0]
+    fig, ax = plt.subplots(figsize=spec['figsize'])
+    data = spec['data']
+    if spec['kind'] == 'hist':
+        edges = data['edges']
+        ax.bar(edges[:-1], data['counts'], width=np.diff(edges), align='edge',
+               color=color, alpha=0.75, edgecolor='white', linewidth=0.5)
+        if data['kde'] is not None:
+            ax.plot(data['grid'], data['kde'], color=color)
+    elif spec['kind'] == 'bar':
+        sns.barplot(x=data['labels'], y=data['values'], ax=ax)
+        ax.tick_params(axis='x', labelrotation=data['rotation'])
+    elif spec['kind'] == 'curve':
+        for y, label, linestyle, marker in data['lines']:
+            ax.plot(data['x'], y, linestyle=linestyle, marker=marker, label=label)
+        ax.set_xscale(data['xscale'])
+        ax.legend()
+    elif spec['kind'] == 'box':
+        ax.bxp(data, patch_artist=True, widths=0.8,
+               boxprops={'facecolor': color}, medianprops={'color': 'black'},
+               flierprops={'marker': 'd', 'markerfacecolor': 'gray', 'markersize': 4})
+    else:
+        raise ValueError(f"Unknown figure kind: {spec['kind']}")
+    ax.set_title(spec['title'])
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel(spec['ylabel'])
+    fig.tight_layout()
+    fig.savefig(spec['filename'])
+    plt.close(fig)
+    return spec['filename']
+
+
+def render_all(figures, workers=1):
+    """Render every figure spec, in a process pool when workers > 1. Returns the saved filenames in order."""
+    if workers > 1 and len(figures) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(figures))) as pool:
+            return list(pool.map(render_figure, figures))
+    return [render_figure(spec) for spec in figures]
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+
+from walmart_aggregate import encode
+
+# Columns with one level per customer / product; far too many levels for the segment cube
+ID_COLUMNS = ['User_ID', 'Product_ID']
+ROLLUP_COLUMNS = ['count', 'total', 'mean']
+
+
+def top_k(values, k, largest=True):
+    """Positions of the k largest (or smallest) values, best first.
+
+    np.argpartition selects the k candidates in linear time and only those k are sorted,
+    instead of sorting every customer or product. Ties keep their original order.
+    """
+    values = np.asarray(values)
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    keys = -values if largest else values
+    candidates = np.argpartition(keys, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    return candidates[np.lexsort((candidates, keys[candidates]))]
+
+
+def _chunk_totals(df, column, value_column):
+    """Distinct IDs of one chunk with their row count and total of `value_column` (one bincount each)."""
+    codes, labels = encode(df[column])
+    values = df[value_column].to_numpy().astype(np.float64)
+    valid = codes >= 0
+    if not valid.all():
+        codes, values = codes[valid], values[valid]
+    count = np.bincount(codes, minlength=len(labels))
+    total = np.bincount(codes, weights=values, minlength=len(labels))
+    present = count > 0
+    return pd.Index(labels)[present], count[present], total[present]
+
+
+def _rollup_table(column, labels, count, total):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return pd.DataFrame({column: labels, 'count': count, 'total': total, 'mean': mean})
+
+
+class IdRollup:
+    """Exact transaction count, total and mean spend per ID (customer or product).
+
+    IDs are mapped to dense integer positions through a hash index (pandas.Index.get_indexer)
+    that grows as new IDs appear, so per-chunk bincounts over the categorical codes add
+    straight into flat count/total arrays. Memory grows with the number of distinct IDs;
+    see HeavyHitters for a fixed-size alternative.
+    """
+
+    def __init__(self, column, value_column='Purchase'):
+        self.column = column
+        self.value_column = value_column
+        self.labels = pd.Index([])
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.float64)
+
+    def _add(self, labels, count, total):
+        positions = self.labels.get_indexer(labels)
+        new = positions < 0
+        if new.any():
+            positions[new] = np.arange(len(self.labels), len(self.labels) + new.sum())
+            self.labels = self.labels.append(labels[new])
+            self.count = np.concatenate([self.count, np.zeros(new.sum(), dtype=np.int64)])
+            self.total = np.concatenate([self.total, np.zeros(new.sum())])
+        # Labels are distinct within one batch, so plain fancy-index addition is safe
+        self.count[positions] += count
+        self.total[positions] += total
+
+    def update(self, df):
+        """Fold a DataFrame (or chunk) in."""
+        self._add(*_chunk_totals(df, self.column, self.value_column))
+        return self
+
+    def merge(self, other):
+        self._add(other.labels, other.count, other.total)
+        return self
+
+    def table(self):
+        """One row per ID with count, total and mean spend."""
+        return _rollup_table(self.column, self.labels, self.count, self.total)
+
+    def top(self, k=10, by='total'):
+        """The k IDs with the largest `by` ('count', 'total' or 'mean'), without sorting all IDs."""
+        if by not in ROLLUP_COLUMNS:
+            raise ValueError(f"Unknown rollup column: {by}")
+        table = self.table()
+        return table.iloc[top_k(table[by].to_numpy(), k)].reset_index(drop=True)
+
+
+class SpaceSaving:
+    """Weighted SpaceSaving summary: the heaviest labels in at most `capacity` counters.
+
+    Every monitored label keeps an upper-bound estimate of its weight and the maximum
+    overestimate; `floor` bounds the weight of any label that is not monitored. A batch is
+    reduced to its distinct labels first and then merged like another summary (Cafaro et al.'s
+    mergeable SpaceSaving), so updates are vectorized and summaries from chunks, files or
+    worker processes combine in any order. Every label heavier than total_weight / capacity
+    is guaranteed to be monitored.
+
+    Each label can also carry a `companion` weight (e.g. its transaction count when ranking by
+    spend). It is summed only while the label is monitored, so it is a lower bound, and exact
+    for labels that were never evicted.
+    """
+
+    def __init__(self, capacity=10_000):
+        self.capacity = capacity
+        self.estimate = pd.Series(dtype=np.float64)
+        self.error = pd.Series(dtype=np.float64)
+        self.companion = pd.Series(dtype=np.float64)
+        self.floor = 0.0
+        self.total_weight = 0.0
+
+    def _truncate(self, estimate, error, companion, floor):
+        if len(estimate) > self.capacity:
+            keep = top_k(estimate.to_numpy(), self.capacity)
+            dropped = np.ones(len(estimate), dtype=bool)
+            dropped[keep] = False
+            # A dropped label's true weight is at most its own estimate
+            floor = max(floor, float(estimate.to_numpy()[dropped].max()))
+            estimate, error, companion = estimate.iloc[keep], error.iloc[keep], companion.iloc[keep]
+        self.estimate, self.error, self.companion, self.floor = estimate, error, companion, floor
+
+    def update(self, labels, weights, companion=None):
+        """Add a batch of (label, weight) pairs; labels must be distinct within the batch.
+
+        The batch is exact (floor 0) and only the merged result is cut back to `capacity`,
+        so memory is bounded by capacity plus one batch of distinct labels.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        companion = np.zeros(len(weights)) if companion is None else np.asarray(companion, dtype=np.float64)
+        batch = SpaceSaving(len(weights))
+        batch.estimate = pd.Series(weights, index=labels)
+        batch.error = pd.Series(0.0, index=labels)
+        batch.companion = pd.Series(companion, index=labels)
+        batch.total_weight = float(weights.sum())
+        return self.merge(batch)
+
+    def merge(self, other):
+        labels = self.estimate.index.union(other.estimate.index, sort=False)
+        # A label missing from one summary may still have up to that summary's floor there
+        estimate = (self.estimate.reindex(labels).fillna(self.floor)
+                    + other.estimate.reindex(labels).fillna(other.floor))
+        error = (self.error.reindex(labels).fillna(self.floor)
+                 + other.error.reindex(labels).fillna(other.floor))
+        companion = self.companion.reindex(labels).fillna(0.0) + other.companion.reindex(labels).fillna(0.0)
+        self.total_weight += other.total_weight
+        self._truncate(estimate, error, companion, self.floor + other.floor)
+        return self
+
+    def top(self, k=10):
+        """The k heaviest monitored labels: (labels, estimates, errors, companions), heaviest first.
+
+        A label's true weight lies in [estimate - error, estimate].
+        """
+        order = top_k(self.estimate.to_numpy(), k)
+        return (self.estimate.index[order], self.estimate.to_numpy()[order], self.error.to_numpy()[order],
+                self.companion.to_numpy()[order])
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'floor': self.floor, 'total_weight': self.total_weight,
+                'labels': self.estimate.index.tolist(), 'estimate': self.estimate.tolist(),
+                'error': self.error.tolist(), 'companion': self.companion.tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        summary = cls(state['capacity'])
+        summary.floor = state['floor']
+        summary.total_weight = state['total_weight']
+        index = pd.Index(state['labels'])
+        summary.estimate = pd.Series(state['estimate'], index=index, dtype=np.float64)
+        summary.error = pd.Series(state['error'], index=index, dtype=np.float64)
+        summary.companion = pd.Series(state['companion'], index=index, dtype=np.float64)
+        return summary
+
+
+class HeavyHitters:
+    """Bounded-memory per-ID rollup for streamed data.
+
+    Two SpaceSaving summaries keep the heaviest IDs by total spend and by transaction count,
+    each carrying the other quantity as its companion weight. Memory is fixed by `capacity`
+    however many distinct IDs there are (millions of customers cost the same as thousands).
+    The ranked quantity is an upper bound within the reported `error`; the companion is a
+    lower bound. Both are exact for IDs that stayed monitored throughout, which is the case
+    for the true heavy hitters unless `capacity` is too small.
+    """
+
+    def __init__(self, column, capacity=10_000, value_column='Purchase'):
+        self.column = column
+        self.value_column = value_column
+        self.by_total = SpaceSaving(capacity)
+        self.by_count = SpaceSaving(capacity)
+
+    def update(self, df):
+        labels, count, total = _chunk_totals(df, self.column, self.value_column)
+        self.by_total.update(labels, total, companion=count)
+        self.by_count.update(labels, count, companion=total)
+        return self
+
+    def merge(self, other):
+        self.by_total.merge(other.by_total)
+        self.by_count.merge(other.by_count)
+        return self
+
+    def top(self, k=10, by='total'):
+        """Estimated top-k IDs by 'total' or 'count', with the same columns as IdRollup.top() plus `error`."""
+        if by == 'total':
+            labels, total, error, count = self.by_total.top(k)
+        elif by == 'count':
+            labels, count, error, total = self.by_count.top(k)
+        else:
+            raise ValueError(f"HeavyHitters can rank by 'total' or 'count', not {by!r}")
+        table = _rollup_table(self.column, labels, count, total)
+        table['error'] = error
+        return table
+
+    def to_dict(self):
+        return {'column': self.column, 'value_column': self.value_column,
+                'by_total': self.by_total.to_dict(), 'by_count': self.by_count.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        hitters = cls(state['column'], value_column=state['value_column'])
+        hitters.by_total = SpaceSaving.from_dict(state['by_total'])
+        hitters.by_count = SpaceSaving.from_dict(state['by_count'])
+        return hitters
+
+
+def top_segments(cube, dimensions, k=5, by='total', min_count=1, total_spend=None):
+    """The k cube segments over `dimensions` with the largest total spend (or count / mean).
+
+    `share` is each segment's part of `total_spend`, which should be the Purchase total over
+    all rows: the cube leaves out rows with a blank or undeclared level, so its own total
+    (the default) is smaller and overstates the shares.
+    """
+    table = cube.rollup(dimensions)
+    table['total'] = table['mean'] * table['count']
+    if total_spend is None:
+        total_spend = table['total'].sum()
+    table = table[table['count'] >= min_count].reset_index(drop=True)
+    table['share'] = table['total'] / total_spend
+    return table.iloc[top_k(table[by].to_numpy(), k)].reset_index(drop=True)
@@ -0,0 +1,478 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import math
+import os
+from http import HTTPStatus
+from urllib.parse import unquote
+
+import numpy as np
+
+from walmart_state import AnalysisState, aggregate_files, shard_paths
+
+DEFAULT_CONFIDENCE = 0.95
+MAX_BODY_BYTES = 1 << 20
+QUERY_OPS = ['mean', 'ci', 'overlap']
+
+
+class QueryError(ValueError):
+    """A query that cannot be answered (unknown dimension or level, empty segment, bad confidence)."""
+
+
+def _level_key(level):
+    # JSON clients may send 0, 0.0 or "0" for Marital_Status; levels are compared as strings
+    if isinstance(level, float) and level.is_integer():
+        level = int(level)
+    if isinstance(level, bool) or not isinstance(level, (str, int)):
+        raise QueryError(f"Segment levels must be strings or integers, not {level!r}")
+    return str(level)
+
+
+def _number(value):
+    """A float for JSON, with NaN/inf (e.g. the std of a one-row segment) as null."""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+class SegmentIndex:
+    """Precomputed statistics of every segment in an AnalysisState, keyed for O(1) lookup.
+
+    Every roll-up of the segment cube over two or more of its dimensions is materialized
+    once. Single levels come from the streamed per-column statistics and the overall
+    population from the all-rows moments, so they match the report even when the cube
+    leaves out rows with a blank level. Columns outside the cube (Age, Product_Category)
+    can only be queried on their own. A segment is
+    identified by its (dimension, level) pairs in cube order, so answering a query is a dict
+    lookup followed by a little arithmetic, done for a whole batch of queries at once.
+    """
+
+    def __init__(self, state, source=None, version=0):
+        self.source = source
+        self.version = version
+        self.loaded_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        self.total_rows = state.total_rows
+        cube = state.cube
+        self.cube_dimensions = list(cube.dimensions)
+        self.levels = {dimension: [str(level) for level in levels]
+                       for dimension, levels in zip(cube.dimensions, cube.levels)}
+        self.solo_dimensions = [column for column in state.group_stats if column not in self.levels]
+
+        keys, counts, means, stds = [], [], [], []
+
+        def add_group_stats(column):
+            group = state.group_stats[column]
+            keys.extend(((column, str(level)),) for level in group.levels)
+            counts.append(group.count().to_numpy())
+            means.append(group.table['mean'].to_numpy())
+            stds.append(group.std().to_numpy())
+
+        # The overall and single-dimension rows cover every row, like the report's numbers; the
+        # cube leaves out rows with a blank or undeclared level in any of its dimensions, so it
+        # is only used for combinations of two or more dimensions.
+        overall = state.overall
+        keys.append(())
+        counts.append([overall.n])
+        means.append([overall.mean])
+        stds.append([overall.sample_std])
+        for r in range(1, len(self.cube_dimensions) + 1):
+            for dimensions in itertools.combinations(self.cube_dimensions, r):
+                if r == 1 and dimensions[0] in state.group_stats:
+                    add_group_stats(dimensions[0])
+                    continue
+                table = cube.rollup(list(dimensions))
+                labels = zip(*(table[dimension].astype(str) for dimension in dimensions))
+                keys += [tuple(zip(dimensions, values)) for values in labels]
+                counts.append(table['count'].to_numpy())
+                means.append(table['mean'].to_numpy())
+                stds.append(table['std'].to_numpy())
+        for column in self.solo_dimensions:
+            self.levels[column] = [str(level) for level in state.group_stats[column].levels]
+            add_group_stats(column)
+
+        self.positions = {key: position for position, key in enumerate(keys)}
+        self.count = np.concatenate(counts).astype(np.int64) if counts else np.zeros(0, dtype=np.int64)
+        self.mean = np.concatenate(means) if means else np.zeros(0)
+        self.std = np.concatenate(stds) if stds else np.zeros(0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.sem = self.std / np.sqrt(self.count)
+        self._order = {dimension: rank for rank, dimension in enumerate(self.cube_dimensions)}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def describe(self):
+        return {'source': self.source, 'version': self.version, 'loaded_at': self.loaded_at,
+                'rows': self.total_rows, 'segments': len(self),
+                'cube_dimensions': self.cube_dimensions, 'solo_dimensions': self.solo_dimensions}
+
+    def position(self, segment):
+        """Row of a segment given as {dimension: level}; {} is the overall population."""
+        if not isinstance(segment, dict):
+            raise QueryError("A segment must be an object of {dimension: level}")
+        items = []
+        for dimension, level in segment.items():
+            if dimension not in self.levels:
+                raise QueryError(f"Unknown dimension: {dimension}")
+            if dimension in self.solo_dimensions and len(segment) > 1:
+                raise QueryError(f"{dimension} is not a cube dimension and can only be queried on its own")
+            level = _level_key(level)
+            if level not in self.levels[dimension]:
+                raise QueryError(f"Unknown level {level!r} for {dimension}; expected one of {self.levels[dimension]}")
+            items.append((dimension, level))
+        key = tuple(sorted(items, key=lambda item: self._order.get(item[0], -1)))
+        position = self.positions.get(key)
+        if position is None:
+            raise QueryError(f"No transactions in segment {dict(key)}")
+        return position, dict(key)
+
+    def parse(self, query):
+        """(op, position a, segment a, position b, segment b, confidence) for one query object."""
+        if not isinstance(query, dict):
+            raise QueryError("A query must be a JSON object")
+        op = query.get('op') or ('overlap' if 'a' in query else 'ci')
+        if op not in QUERY_OPS:
+            raise QueryError(f"Unknown op {op!r}; expected one of {QUERY_OPS}")
+        confidence = query.get('confidence', DEFAULT_CONFIDENCE)
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 < confidence < 1:
+            raise QueryError(f"confidence must be a number between 0 and 1, not {confidence!r}")
+        if op == 'overlap':
+            if 'a' not in query or 'b' not in query:
+                raise QueryError("An overlap query needs segments 'a' and 'b'")
+            a, segment_a = self.position(query['a'])
+            b, segment_b = self.position(query['b'])
+        else:
+            a, segment_a = self.position(query.get('segment', {}))
+            b, segment_b = -1, None
+        return op, a, segment_a, b, segment_b, float(confidence)
+
+    def evaluate(self, queries):
+        """Answer a batch of query objects, in order; a query that cannot be answered gets {'error': ...}.
+
+        The CLT intervals (and the Welch tests of overlap queries) of the whole batch are
+        computed in one vectorized step, the same way as walmart_aggregate.confidence_intervals()
+        and walmart_cube.pairwise_tests().
+        """
+        from scipy import special
+        results = [None] * len(queries)
+        parsed = []
+        for i, query in enumerate(queries):
+            try:
+                parsed.append((i, *self.parse(query)))
+            except QueryError as error:
+                results[i] = {'error': str(error)}
+        if not parsed:
+            return results
+
+        index, ops, a, segments_a, b, segments_b, confidence = zip(*parsed)
+        a, b, confidence = np.asarray(a), np.asarray(b), np.asarray(confidence)
+        z = special.ndtri((1 + confidence) / 2)
+        # A zero or undefined SEM gives the degenerate interval (mean, mean), as in the report
+        margin_a = np.nan_to_num(z * self.sem[a])
+        # Queries without a second segment compute against row 0 and ignore it
+        b = np.maximum(b, 0)
+        margin_b = np.nan_to_num(z * self.sem[b])
+        var_a, var_b = self.sem[a] ** 2, self.sem[b] ** 2
+        n_a, n_b = self.count[a].astype(np.float64), self.count[b].astype(np.float64)
+        diff = self.mean[a] - self.mean[b]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = diff / np.sqrt(var_a + var_b)
+            dof = (var_a + var_b) ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+        p_value = 2 * special.stdtr(dof, -np.abs(t))
+
+        def segment_result(position, segment, margin, with_interval):
+            result = {'segment': segment, 'count': int(self.count[position]), 'mean': _number(self.mean[position]),
+                      'std': _number(self.std[position]), 'sem': _number(self.sem[position])}
+            if with_interval:
+                result['lower'] = _number(self.mean[position] - margin)
+                result['upper'] = _number(self.mean[position] + margin)
+            return result
+
+        for k, i in enumerate(index):
+            first = segment_result(a[k], segments_a[k], margin_a[k], ops[k] != 'mean')
+            if ops[k] == 'mean':
+                results[i] = {'op': 'mean', **first}
+            elif ops[k] == 'ci':
+                results[i] = {'op': 'ci', 'confidence': confidence[k], **first}
+            else:
+                second = segment_result(b[k], segments_b[k], margin_b[k], True)
+                overlap = first['lower'] < second['upper'] and second['lower'] < first['upper']
+                results[i] = {'op': 'overlap', 'confidence': confidence[k], 'a': first, 'b': second,
+                              'overlap': bool(overlap), 'diff': _number(diff[k]), 't': _number(t[k]),
+                              'dof': _number(dof[k]), 'p_value': _number(p_value[k])}
+        return results
+
+
+def is_state_file(source):
+    return source.endswith('.json')
+
+
+def source_signature(source):
+    """(path, size, mtime_ns) of every file behind `source`; it changes when the data does."""
+    paths = [source] if is_state_file(source) else shard_paths(source)
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def load_index(source, chunksize=100_000, workers=1, version=0):
+    """Build a SegmentIndex from a saved state (walmart_state.py) or by aggregating CSV files."""
+    if is_state_file(source):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"state file {source} not found.")
+        state = AnalysisState.load(source)
+    else:
+        state = aggregate_files(shard_paths(source), chunksize=chunksize, workers=workers)
+    return SegmentIndex(state, source=source, version=version)
+
+
+def _parse_query_string(query_string):
+    # '+' stays a plus sign: it is part of levels such as '55+' and '4+'
+    params = {}
+    for part in query_string.split('&'):
+        if part:
+            name, _, value = part.partition('=')
+            params[unquote(name)] = unquote(value)
+    return params
+
+
+def _parse_segment(text):
+    """'Gender:M,Age_Group:26-35' -> {'Gender': 'M', 'Age_Group': '26-35'}."""
+    segment = {}
+    for item in filter(None, text.split(',')):
+        dimension, separator, level = item.partition(':')
+        if not separator:
+            raise QueryError(f"Expected dimension:level, got {item!r}")
+        segment[dimension] = level
+    return segment
+
+
+class QueryService:
+    """asyncio HTTP/JSON service answering segment queries from an in-memory SegmentIndex.
+
+    Queries from all open connections go through one queue. The batcher takes everything
+    that is waiting (up to `max_batch` queries) and answers it with a single
+    SegmentIndex.evaluate() call, so many small concurrent requests share one vectorized
+    computation. Every `reload_interval` seconds the source files are checked; when they
+    have changed, a new index is built in a worker thread while queries keep being served
+    from the old one, and then swapped in.
+    """
+
+    def __init__(self, source, reload_interval=2.0, chunksize=100_000, workers=1, max_batch=1024):
+        self.source = source
+        self.reload_interval = reload_interval
+        self.chunksize = chunksize
+        self.workers = workers
+        self.max_batch = max_batch
+        self.index = None
+        self.signature = None
+        self.last_error = None
+        self.queries_served = 0
+        self._queue = None
+        self._reload_lock = None
+
+    def _build(self, version):
+        signature = source_signature(self.source)
+        return signature, load_index(self.source, chunksize=self.chunksize, workers=self.workers, version=version)
+
+    async def reload(self, force=False):
+        """Rebuild the index if the source changed (or always, with force). Returns True if it was swapped."""
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            try:
+                if not force and await loop.run_in_executor(None, source_signature, self.source) == self.signature:
+                    # The source is back to what the current index was built from
+                    self.last_error = None
+                    return False
+                version = self.index.version + 1 if self.index else 1
+                self.signature, self.index = await loop.run_in_executor(None, self._build, version)
+                self.last_error = None
+            except (OSError, ValueError, KeyError) as error:
+                # Keep serving the last good index (e.g. while a file is being rewritten)
+                self.last_error = f"{type(error).__name__}: {error}"
+                print(f"Reload of {self.source} failed, still serving version "
+                      f"{self.index.version if self.index else None}: {self.last_error}")
+                return False
+            print(f"Loaded {self.source}: version {self.index.version}, {len(self.index)} segments, "
+                  f"{self.index.total_rows} rows.")
+            return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as error:
+                # An unexpected failure must not end the polling task and leave /health
+                # reporting a watcher that is no longer running
+                self.last_error = f"{type(error).__name__}: {error}"
+                print(f"Reload of {self.source} failed, still serving version "
+                      f"{self.index.version if self.index else None}: {self.last_error}")
+
+    async def query(self, queries):
+        """Answer a list of query objects through the shared batcher."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((queries, future))
+        return await future
+
+    async def _batcher(self):
+        while True:
+            pending = [await self._queue.get()]
+            # Let connections whose requests are already readable enqueue theirs into this batch
+            await asyncio.sleep(0)
+            size = len(pending[0][0])
+            while not self._queue.empty() and size < self.max_batch:
+                pending.append(self._queue.get_nowait())
+                size += len(pending[-1][0])
+            queries = [query for batch, _ in pending for query in batch]
+            try:
+                results = self.index.evaluate(queries)
+            except Exception as error:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.queries_served += len(queries)
+            start = 0
+            for batch, future in pending:
+                if not future.done():
+                    future.set_result(results[start:start + len(batch)])
+                start += len(batch)
+
+    async def _single(self, query):
+        result = (await self.query([query]))[0]
+        return (HTTPStatus.BAD_REQUEST if 'error' in result else HTTPStatus.OK), result
+
+    async def dispatch(self, method, target, body):
+        """(status, JSON payload) for one request."""
+        path, _, query_string = target.partition('?')
+        params = _parse_query_string(query_string)
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, {'status': 'degraded' if self.last_error else 'ok', 'last_error': self.last_error,
+                                   'queries_served': self.queries_served, **self.index.describe()}
+        if method == 'GET' and path == '/dimensions':
+            return HTTPStatus.OK, {'cube': {dimension: self.index.levels[dimension]
+                                            for dimension in self.index.cube_dimensions},
+                                   'solo': {dimension: self.index.levels[dimension]
+                                            for dimension in self.index.solo_dimensions}}
+        if method == 'GET' and path in ('/mean', '/ci', '/segment'):
+            confidence = params.pop('confidence', DEFAULT_CONFIDENCE)
+            try:
+                confidence = float(confidence)
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST, {'error': f"confidence must be a number, not {confidence!r}"}
+            op = 'mean' if path == '/mean' else 'ci'
+            return await self._single({'op': op, 'segment': params, 'confidence': confidence})
+        if method == 'GET' and path == '/overlap':
+            try:
+                query = {'op': 'overlap', 'a': _parse_segment(params.get('a', '')),
+                         'b': _parse_segment(params.get('b', '')),
+                         'confidence': float(params.get('confidence', DEFAULT_CONFIDENCE))}
+            except (QueryError, ValueError) as error:
+                return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+            return await self._single(query)
+        if method == 'POST' and path == '/query':
+            try:
+                payload = json.loads(body or b'null')
+            except ValueError as error:
+                return HTTPStatus.BAD_REQUEST, {'error': f"Invalid JSON: {error}"}
+            if isinstance(payload, list):
+                if len(payload) > self.max_batch:
+                    return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': f"At most {self.max_batch} queries per request"}
+                return HTTPStatus.OK, {'results': await self.query(payload)}
+            return await self._single(payload)
+        if method == 'POST' and path == '/reload':
+            reloaded = await self.reload(force=True)
+            return (HTTPStatus.OK if reloaded else HTTPStatus.INTERNAL_SERVER_ERROR), \
+                {'reloaded': reloaded, 'last_error': self.last_error, **self.index.describe()}
+        if path in ('/health', '/dimensions', '/mean', '/ci', '/segment', '/overlap', '/query', '/reload'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"{method} is not supported on {path}"}
+        return HTTPStatus.NOT_FOUND, {'error': f"Unknown path: {path}"}
+
+    async def _handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection (keep-alive) until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                parts = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                if len(parts) != 3:
+                    status, payload, keep_alive = HTTPStatus.BAD_REQUEST, {'error': "Malformed request line"}, False
+                elif length > MAX_BODY_BYTES:
+                    status, payload, keep_alive = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Body too large"}, False
+                else:
+                    method, target, version = parts
+                    body = await reader.readexactly(length) if length else b''
+                    try:
+                        status, payload = await self.dispatch(method, target, body)
+                    except Exception as error:
+                        status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"}
+                    keep_alive = (headers.get('connection', '').lower() != 'close'
+                                  if version == 'HTTP/1.1' else headers.get('connection', '').lower() == 'keep-alive')
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        """Load the index, then serve until cancelled."""
+        self._queue = asyncio.Queue()
+        self._reload_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        # Fail fast on a bad source at startup; later reload errors keep the old index
+        self.signature, self.index = await loop.run_in_executor(None, self._build, 1)
+        print(f"Loaded {self.source}: version 1, {len(self.index)} segments, {self.index.total_rows} rows.")
+        tasks = [asyncio.create_task(self._batcher())]
+        if self.reload_interval > 0:
+            tasks.append(asyncio.create_task(self._watch()))
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"Serving segment queries on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serve mean / confidence interval / overlap queries over precomputed segment statistics.")
+    parser.add_argument('source', help="Aggregate state JSON from `walmart_state.py update`, or a transaction CSV, "
+                                       "directory or glob pattern to aggregate at startup.")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on (default: localhost only).")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on.")
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help="Seconds between checks of the source for changes (0 disables hot reload).")
+    parser.add_argument('--max-batch', type=int, default=1024, help="Most queries answered in one batch.")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="Rows per chunk when aggregating CSVs.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes when aggregating CSV shards.")
+    args = parser.parse_args()
+    service = QueryService(args.source, reload_interval=args.reload_interval, chunksize=args.chunksize,
+                           workers=args.workers, max_batch=args.max_batch)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    except FileNotFoundError as error:
+        print(f"Error: {error}")
+        raise SystemExit(1)
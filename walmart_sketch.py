@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+
+from walmart_aggregate import encode
+
+# Relative capacity of each compactor below the top one (KLL's c)
+CAPACITY_DECAY = 2 / 3
+MIN_CAPACITY = 2
+# Dimensions whose per-level Purchase distribution is sketched (the box plots' x axes)
+SKETCH_DIMENSIONS = ['Gender', 'Marital_Status', 'Age_Group', 'City_Category']
+
+
+def k_for_error(rank_error):
+    """Top compactor size giving roughly `rank_error` normalised rank error for a single quantile.
+
+    Uses the empirical fit published for the Apache DataSketches KLL sketch: eps ~ 2.296 / k^0.9723.
+    """
+    return max(8, int(np.ceil((2.296 / rank_error) ** (1 / 0.9723))))
+
+
+class KLLSketch:
+    """Mergeable approximate-quantile sketch (Karnin, Lang & Liberty's KLL).
+
+    Items are kept in a stack of compactors; an item in compactor h stands for 2**h
+    original values. When the sketch grows past its capacity, the lowest over-full compactor
+    is sorted and every other item (random offset) is promoted one level up. Batches are
+    inserted with numpy, so updating with a 100k-row chunk is a few sorts, not 100k calls.
+    Two sketches merge by concatenating their compactors level by level and compacting again,
+    so sketches from different chunks or files can be combined in any order. The exact count,
+    minimum and maximum are tracked alongside.
+    """
+
+    def __init__(self, rank_error=0.01, seed=0):
+        self.rank_error = rank_error
+        self.k = k_for_error(rank_error)
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(MIN_CAPACITY, int(np.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _size(self):
+        return sum(len(items) for items in self.levels)
+
+    def _total_capacity(self):
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        while self._size() > self._total_capacity():
+            for level, items in enumerate(self.levels):
+                if len(items) >= self._capacity(level):
+                    break
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind so the promoted half has exactly half the weight.
+            keep = items[-1:] if len(items) % 2 else items[:0]
+            pairs = items[:len(items) - len(keep)]
+            promoted = pairs[self._rng.integers(2)::2]
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def update(self, values):
+        """Add a batch of values (NaNs are ignored)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2 ** level, dtype=np.float64)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Approximate quantile(s); q = 0 and q = 1 return the exact minimum and maximum."""
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        items, cumulative = self._weighted_items()
+        idx = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+        result = items[np.minimum(idx, len(items) - 1)]
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+        return result if q.ndim else float(result)
+
+    def rank(self, values):
+        """Approximate fraction of values <= each of `values` (NaN while the sketch is empty)."""
+        if self.count == 0:
+            return np.full(np.shape(values), np.nan)
+        items, cumulative = self._weighted_items()
+        idx = np.searchsorted(items, np.asarray(values, dtype=np.float64), side='right')
+        ranks = np.concatenate([[0.0], cumulative])[idx]
+        return ranks / cumulative[-1]
+
+    def retained(self):
+        """The items currently stored (each a real observed value) with their weights."""
+        return (np.concatenate(self.levels),
+                np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self.levels)]))
+
+    def to_dict(self):
+        return {'rank_error': self.rank_error, 'seed': self.seed, 'count': self.count,
+                'min': self.min, 'max': self.max, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['rank_error'], state['seed'])
+        sketch.count = state['count']
+        sketch.min = state['min']
+        sketch.max = state['max']
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in state['levels']]
+        return sketch
+
+
+def max_rank_error(sketch, values, quantiles=np.linspace(0.01, 0.99, 99)):
+    """Largest normalised rank error of the sketch's quantiles against the exact data.
+
+    Used to check a sketch against the in-memory column: 0.01 means every reported quantile
+    sits within 1% of the true rank.
+    """
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    estimates = sketch.quantile(quantiles)
+    low = np.searchsorted(values, estimates, side='left') / len(values)
+    high = np.searchsorted(values, estimates, side='right') / len(values)
+    # The estimate's true rank is anywhere in [low, high] when it is a repeated value.
+    error = np.where(quantiles < low, low - quantiles, np.where(quantiles > high, quantiles - high, 0.0))
+    return float(error.max())
+
+
+class SegmentSketches:
+    """A KLLSketch of Purchase for the whole table and for every level of each dimension."""
+
+    def __init__(self, dimensions, rank_error=0.01, value_column='Purchase'):
+        self.dimensions = list(dimensions)
+        self.rank_error = rank_error
+        self.value_column = value_column
+        self.overall = KLLSketch(rank_error)
+        self.segments = {dimension: {} for dimension in self.dimensions}
+
+    def _sketch(self, dimension, level):
+        segment = self.segments[dimension]
+        if level not in segment:
+            segment[level] = KLLSketch(self.rank_error, seed=len(segment) + 1)
+        return segment[level]
+
+    def update(self, df):
+        """Fold a chunk into the overall and per-segment sketches."""
+        values = df[self.value_column].to_numpy(dtype=np.float64)
+        self.overall.update(values)
+        for dimension in self.dimensions:
+            if dimension not in df.columns:
+                continue
+            codes, levels = encode(df[dimension])
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(levels) + 1))
+            for k, level in enumerate(levels):
+                if bounds[k + 1] > bounds[k]:
+                    self._sketch(dimension, level).update(values[order[bounds[k]:bounds[k + 1]]])
+        return self
+
+    def merge(self, other):
+        self.overall.merge(other.overall)
+        for dimension, segment in other.segments.items():
+            for level, sketch in segment.items():
+                if dimension not in self.segments:
+                    self.segments[dimension] = {}
+                    self.dimensions.append(dimension)
+                if level in self.segments[dimension]:
+                    self.segments[dimension][level].merge(sketch)
+                else:
+                    self.segments[dimension][level] = KLLSketch.from_dict(sketch.to_dict())
+        return self
+
+    def describe(self, mean=None, std=None):
+        """Purchase distribution summary in the shape of Series.describe(), with sketched quartiles.
+
+        The sketch does not track moments; pass the exact mean and std from the running
+        accumulators to fill those rows.
+        """
+        q1, median, q3 = self.overall.quantile([0.25, 0.5, 0.75])
+        return pd.Series({'count': float(self.overall.count), 'mean': mean, 'std': std,
+                          'min': self.overall.min, '25%': q1, '50%': median, '75%': q3,
+                          'max': self.overall.max}, name=self.value_column)
+
+    def to_dict(self):
+        return {'dimensions': self.dimensions, 'rank_error': self.rank_error, 'value_column': self.value_column,
+                'overall': self.overall.to_dict(),
+                'segments': {dimension: [[level, sketch.to_dict()] for level, sketch in segment.items()]
+                             for dimension, segment in self.segments.items()}}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketches = cls(state['dimensions'], state['rank_error'], state['value_column'])
+        sketches.overall = KLLSketch.from_dict(state['overall'])
+        sketches.segments = {dimension: {level: KLLSketch.from_dict(sketch) for level, sketch in segment}
+                             for dimension, segment in state['segments'].items()}
+        return sketches
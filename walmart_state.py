@@ -0,0 +1,229 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from walmart_cache import source_fingerprint
+from walmart_cube import SegmentCube
+from walmart_loader import STREAM_SCHEMA, prepare_chunk
+from walmart_rollup import ID_COLUMNS, HeavyHitters
+from walmart_sketch import SKETCH_DIMENSIONS, SegmentSketches
+from walmart_streaming import GROUP_COLUMNS, GroupStats, OverallStats, stream_group_stats
+
+STATE_FORMAT_VERSION = 3
+
+
+class AnalysisState:
+    """Persisted aggregate state: everything the report needs, without the raw rows.
+
+    Holds the per-column GroupStats (count/mean/M2), the same moments over all rows (the cube
+    leaves out rows with a blank demographic level), the SegmentCube (count/sum/sum of squares),
+    the quantile sketches, the per-customer/per-product heavy hitters, total rows and null counts,
+    plus the list of files already folded in.
+    Files are identified by their SHA-256, so re-running an update over the same files (or a
+    renamed copy) does not count anything twice.
+    """
+
+    def __init__(self, rank_error=0.01):
+        self.group_stats = {column: GroupStats(column) for column in GROUP_COLUMNS}
+        self.overall = OverallStats()
+        self.cube = SegmentCube()
+        self.sketches = SegmentSketches(SKETCH_DIMENSIONS, rank_error=rank_error)
+        self.heavy_hitters = {column: HeavyHitters(column) for column in ID_COLUMNS}
+        self.total_rows = 0
+        self.null_counts = pd.Series(dtype='int64')
+        self.files = {}
+
+    @classmethod
+    def from_file(cls, path, chunksize=100_000, rank_error=0.01, fingerprint=None):
+        """Aggregate one CSV into a new state holding just that file."""
+        fingerprint = fingerprint or source_fingerprint(path)
+        state = cls(rank_error=rank_error)
+        state.group_stats, state.total_rows, null_counts = stream_group_stats(
+            path, prepare_chunk, chunksize=chunksize, dtype=STREAM_SCHEMA,
+            accumulators=state.accumulators())
+        if null_counts is not None:
+            state.null_counts = null_counts
+        state.files[fingerprint['sha256']] = {'path': os.path.abspath(path), 'size': fingerprint['size'],
+                                              'mtime_ns': fingerprint['mtime_ns'], 'rows': state.total_rows}
+        return state
+
+    def accumulators(self):
+        """The chunk accumulators to pass to stream_group_stats() besides the GroupStats."""
+        return [self.overall, self.cube, self.sketches, *self.heavy_hitters.values()]
+
+    def _check_new(self, path, fingerprint):
+        """True if the file is not in the state yet; raises if its path was ingested with other contents."""
+        if fingerprint['sha256'] in self.files:
+            return False
+        abspath = os.path.abspath(path)
+        for sha256, entry in self.files.items():
+            if entry['path'] == abspath:
+                raise ValueError(f"{path} was already ingested with different contents; "
+                                 f"new transactions must arrive as new files (or rebuild the state).")
+        return True
+
+    def merge(self, other):
+        """Fold another state in exactly (Chan-merged moments, added cube arrays, merged sketches)."""
+        overlap = set(self.files) & set(other.files)
+        if overlap:
+            raise ValueError(f"States share {len(overlap)} ingested file(s); merging would count them twice.")
+        for column, accumulator in other.group_stats.items():
+            self.group_stats.setdefault(column, GroupStats(column)).merge(accumulator)
+        self.overall.merge(other.overall)
+        self.cube.merge(other.cube)
+        self.sketches.merge(other.sketches)
+        for column, hitters in other.heavy_hitters.items():
+            self.heavy_hitters[column].merge(hitters)
+        self.total_rows += other.total_rows
+        # Keep the file's column order (Series.add would sort the index)
+        columns = self.null_counts.index.union(other.null_counts.index, sort=False)
+        self.null_counts = (self.null_counts.reindex(columns, fill_value=0)
+                            + other.null_counts.reindex(columns, fill_value=0)).astype('int64')
+        self.files.update(other.files)
+        return self
+
+    def ingest(self, path, chunksize=100_000):
+        """Fold one CSV into the state. Returns False when the file was already ingested.
+
+        The file is aggregated into a separate state first and only merged once it has been
+        read completely, so a failed read leaves the state untouched.
+        """
+        return self.ingest_many([path], chunksize=chunksize)[0]
+
+    def ingest_many(self, paths, chunksize=100_000, workers=1):
+        """Fold several CSVs into the state, aggregating them in a process pool when workers > 1.
+
+        Each new file is aggregated on its own (the map step) and the partial states are merged
+        in the order of `paths` (the reduce step), so the result does not depend on `workers`.
+        Returns one flag per path: False for files that were already ingested (or repeated).
+        """
+        pending, ingested, seen = [], [], set()
+        for path in paths:
+            fingerprint = source_fingerprint(path)
+            is_new = fingerprint['sha256'] not in seen and self._check_new(path, fingerprint)
+            seen.add(fingerprint['sha256'])
+            ingested.append(is_new)
+            if is_new:
+                pending.append((path, fingerprint))
+
+        rank_error = self.sketches.rank_error
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+                partials = pool.map(_aggregate_file, [(path, chunksize, rank_error, fingerprint)
+                                                      for path, fingerprint in pending])
+                for partial in partials:
+                    self.merge(partial)
+        else:
+            for path, fingerprint in pending:
+                self.merge(_aggregate_file((path, chunksize, rank_error, fingerprint)))
+        return ingested
+
+    def to_dict(self):
+        return {'format_version': STATE_FORMAT_VERSION,
+                'group_stats': {column: accumulator.to_dict() for column, accumulator in self.group_stats.items()},
+                'overall': self.overall.to_dict(),
+                'cube': self.cube.to_dict(),
+                'sketches': self.sketches.to_dict(),
+                'heavy_hitters': {column: hitters.to_dict() for column, hitters in self.heavy_hitters.items()},
+                'total_rows': self.total_rows,
+                'null_counts': {column: int(count) for column, count in self.null_counts.items()},
+                'files': self.files}
+
+    @classmethod
+    def from_dict(cls, state):
+        if state.get('format_version') != STATE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported state format: {state.get('format_version')}")
+        result = cls()
+        result.group_stats = {column: GroupStats.from_dict(accumulator)
+                              for column, accumulator in state['group_stats'].items()}
+        result.overall = OverallStats.from_dict(state['overall'])
+        result.cube = SegmentCube.from_dict(state['cube'])
+        result.sketches = SegmentSketches.from_dict(state['sketches'])
+        result.heavy_hitters = {column: HeavyHitters.from_dict(hitters)
+                                for column, hitters in state['heavy_hitters'].items()}
+        result.total_rows = state['total_rows']
+        result.null_counts = pd.Series(state['null_counts'], dtype='int64')
+        result.files = state['files']
+        return result
+
+    def save(self, path):
+        """Write the state as JSON, atomically (write to a temporary file, then rename)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, rank_error=0.01):
+        """Load a saved state, or start an empty one if `path` does not exist yet."""
+        if not os.path.exists(path):
+            return cls(rank_error=rank_error)
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def _aggregate_file(task):
+    path, chunksize, rank_error, fingerprint = task
+    return AnalysisState.from_file(path, chunksize=chunksize, rank_error=rank_error, fingerprint=fingerprint)
+
+
+def shard_paths(spec):
+    """The CSV files named by `spec`: a single file, a directory (its *.csv) or a glob pattern, sorted."""
+    if os.path.isdir(spec):
+        paths = glob.glob(os.path.join(spec, '*.csv'))
+    elif any(char in spec for char in '*?['):
+        paths = glob.glob(spec)
+    else:
+        return [spec]
+    if not paths:
+        raise FileNotFoundError(f"No CSV files match {spec}")
+    return sorted(paths)
+
+
+def aggregate_files(paths, chunksize=100_000, rank_error=0.01, workers=1):
+    """Aggregate many shard files into one in-memory AnalysisState (nothing is saved)."""
+    state = AnalysisState(rank_error=rank_error)
+    state.ingest_many(paths, chunksize=chunksize, workers=workers)
+    return state
+
+
+def update(state_path, paths, chunksize=100_000, rank_error=0.01, workers=1):
+    """Fold any not-yet-ingested files into the state at `state_path` and save it."""
+    state = AnalysisState.load(state_path, rank_error=rank_error)
+    for path, ingested in zip(paths, state.ingest_many(paths, chunksize=chunksize, workers=workers)):
+        if ingested:
+            print(f"Ingested {path}")
+        else:
+            print(f"Skipped {path} (already ingested)")
+    state.save(state_path)
+    print(f"State saved to {state_path}: {len(state.files)} files, {state.total_rows} rows.")
+    return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the persisted aggregate state used by walmart_analysis.py --state.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help="Fold new transaction CSVs into the state.")
+    update_parser.add_argument('state_path', help="State file (created if missing).")
+    update_parser.add_argument('paths', nargs='+',
+                               help="Transaction CSV files, directories or glob patterns; already-ingested files are skipped.")
+    update_parser.add_argument('--chunksize', type=int, default=100_000, help="Rows per chunk while reading.")
+    update_parser.add_argument('--sketch-error', type=float, default=0.01,
+                               help="Rank error bound of the quantile sketches (only used for a new state).")
+    update_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                               help="Worker processes aggregating new files in parallel.")
+    args = parser.parse_args()
+    try:
+        paths = [path for spec in args.paths for path in shard_paths(spec)]
+        update(args.state_path, paths, chunksize=args.chunksize, rank_error=args.sketch_error, workers=args.workers)
+    except FileNotFoundError as error:
+        # A missing file or a pattern matching nothing; the state file is left as it was
+        sys.exit(f"Error: {error.filename + ' not found.' if error.filename else error}")
+    except ValueError as error:
+        # A path re-added with changed contents, or an unsupported state file
+        sys.exit(f"Error: {error}")
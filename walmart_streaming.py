@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+from walmart_aggregate import encode, grouped_moments
+
+# Columns we keep running Purchase statistics for.
+# Age_Group is derived from Age, so the chunk has to be prepared before it is folded in.
+GROUP_COLUMNS = ['Gender', 'Age', 'Age_Group', 'Occupation', 'City_Category',
+                 'Stay_In_Current_City_Years', 'Marital_Status', 'Product_Category']
+
+
+class GroupStats:
+    """Running count / mean / sum of squared deviations (M2) of Purchase for every level of one column.
+
+    Chunks are merged with the parallel form of Welford's algorithm (Chan et al.),
+    so we never need the raw Purchase values once a chunk has been folded in.
+    """
+
+    def __init__(self, column):
+        self.column = column
+        self.table = pd.DataFrame({'count': pd.Series(dtype='int64'),
+                                   'mean': pd.Series(dtype='float64'),
+                                   'm2': pd.Series(dtype='float64')})
+
+    def update(self, chunk, value_column='Purchase'):
+        """Fold the rows of a DataFrame chunk into the running statistics."""
+        codes, levels = encode(chunk[self.column])
+        count, mean, m2 = grouped_moments(codes, chunk[value_column].to_numpy(), len(levels))
+        self._merge_table(pd.DataFrame({'count': count, 'mean': mean, 'm2': m2}, index=levels))
+        return self
+
+    def merge(self, other):
+        """Combine the statistics of another GroupStats for the same column."""
+        self._merge_table(other.table)
+        return self
+
+    def _merge_table(self, other):
+        other = other[other['count'] > 0]
+        if self.table.empty:
+            self.table = other.astype({'count': 'int64', 'mean': 'float64', 'm2': 'float64'}).copy()
+            return
+        index = self.table.index.union(other.index)
+        a = self.table.reindex(index)
+        b = other.reindex(index)
+        n_a = a['count'].fillna(0)
+        n_b = b['count'].fillna(0)
+        n = n_a + n_b
+        delta = b['mean'].fillna(0) - a['mean'].fillna(0)
+        # Levels present on only one side keep their own mean; fillna keeps NaN out of the arithmetic.
+        mean = np.where(n_a == 0, b['mean'], np.where(n_b == 0, a['mean'], a['mean'] + delta * n_b / n))
+        m2 = a['m2'].fillna(0) + b['m2'].fillna(0) + delta ** 2 * n_a * n_b / n
+        self.table = pd.DataFrame({'count': n.astype('int64'), 'mean': mean, 'm2': m2}, index=index)
+
+    def to_dict(self):
+        return {'column': self.column, 'levels': self.table.index.tolist(),
+                'count': self.table['count'].tolist(), 'mean': self.table['mean'].tolist(),
+                'm2': self.table['m2'].tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        stats_ = cls(state['column'])
+        stats_.table = pd.DataFrame({'count': np.asarray(state['count'], dtype='int64'),
+                                    'mean': np.asarray(state['mean'], dtype='float64'),
+                                    'm2': np.asarray(state['m2'], dtype='float64')},
+                                   index=pd.Index(state['levels'], dtype=object))
+        return stats_
+
+    @property
+    def levels(self):
+        return list(self.table.index)
+
+    def count(self):
+        return self.table['count']
+
+    def std(self):
+        """Sample standard deviation (ddof=1) per level, matching pandas' Series.std()."""
+        return np.sqrt(self.table['m2'] / (self.table['count'] - 1))
+
+
+class OverallStats(GroupStats):
+    """Running count / mean / M2 of Purchase over every row, as a single level.
+
+    Unlike the segment cube, which leaves out rows with a blank or undeclared demographic
+    level, this covers all rows that have a Purchase amount, like the quantile sketches do.
+    """
+
+    LEVEL = 'All'
+
+    def __init__(self, column=None):
+        super().__init__(None)
+
+    def update(self, chunk, value_column='Purchase'):
+        values = chunk[value_column].to_numpy()
+        count, mean, m2 = grouped_moments(np.zeros(len(values), dtype=np.intp), values, 1)
+        self._merge_table(pd.DataFrame({'count': count, 'mean': mean, 'm2': m2}, index=[self.LEVEL]))
+        return self
+
+    @property
+    def n(self):
+        return int(self.table['count'].sum())
+
+    @property
+    def mean(self):
+        return float(self.table['mean'].iloc[0]) if self.n else np.nan
+
+    @property
+    def total(self):
+        """Sum of Purchase over all rows."""
+        return self.mean * self.n if self.n else 0.0
+
+    @property
+    def sample_std(self):
+        return float(self.std().iloc[0]) if self.n > 1 else np.nan
+
+
+def stream_group_stats(path, prepare_chunk=None, columns=GROUP_COLUMNS, chunksize=100_000, dtype=None,
+                       accumulators=()):
+    """Read a CSV in chunks and return ({column: GroupStats}, total_rows, null_counts).
+
+    Only one chunk is held in memory at a time, so peak memory depends on `chunksize`
+    and not on the size of the file. `prepare_chunk` is called on every chunk before it
+    is folded in (cleaning, deriving Age_Group, ...). `dtype` is passed to read_csv.
+    Any extra `accumulators` (objects with an update(chunk) method, e.g. a SegmentCube)
+    are fed the same prepared chunks.
+    """
+    group_stats = {column: GroupStats(column) for column in columns}
+    total_rows = 0
+    null_counts = None
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtype):
+        total_rows += len(chunk)
+        chunk_nulls = chunk.isnull().sum()
+        null_counts = chunk_nulls if null_counts is None else null_counts.add(chunk_nulls, fill_value=0)
+        if prepare_chunk is not None:
+            chunk = prepare_chunk(chunk)
+        for column, accumulator in group_stats.items():
+            if column in chunk.columns:
+                accumulator.update(chunk)
+        for accumulator in accumulators:
+            accumulator.update(chunk)
+    return group_stats, total_rows, null_counts
@@ -0,0 +1,161 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from walmart_loader import AGE_CATEGORIES, CITY_CATEGORIES, GENDER_CATEGORIES, STAY_CATEGORIES
+
+# Level frequencies of the original 550,068-row Black Friday export
+GENDER_WEIGHTS = {'F': 135809, 'M': 414259}
+AGE_WEIGHTS = {'0-17': 15102, '18-25': 99660, '26-35': 219587, '36-45': 110013, '46-50': 45701,
+               '51-55': 38501, '55+': 21504}
+CITY_WEIGHTS = {'A': 147720, 'B': 231173, 'C': 171175}
+STAY_WEIGHTS = {'0': 74398, '1': 193821, '2': 101838, '3': 95285, '4+': 84726}
+MARITAL_WEIGHTS = {0: 324731, 1: 225337}
+OCCUPATION_WEIGHTS = {0: 69638, 1: 47426, 2: 26588, 3: 17650, 4: 72308, 5: 12177, 6: 20355, 7: 59133,
+                      8: 1546, 9: 6291, 10: 12930, 11: 11586, 12: 31179, 13: 7728, 14: 27309, 15: 12165,
+                      16: 25371, 17: 40043, 18: 6622, 19: 8461, 20: 33562}
+# Product_Category -> (transactions, mean Purchase); the category mix is what makes Purchase
+# right-skewed overall
+PRODUCT_CATEGORIES = {1: (140378, 13607), 2: (23864, 11251), 3: (20213, 10096), 4: (11753, 2329),
+                      5: (150933, 6240), 6: (20466, 15838), 7: (3721, 16366), 8: (113925, 7499),
+                      9: (410, 15537), 10: (5125, 19676), 11: (24287, 4685), 12: (3947, 1350),
+                      13: (5549, 722), 14: (1523, 13141), 15: (6290, 14781), 16: (9828, 14766),
+                      17: (578, 10171), 18: (3125, 2973), 19: (1603, 37), 20: (2550, 370)}
+# Spend multipliers reproducing the original gaps (men ~8% above women, 51+ highest, 0-17 lowest)
+GENDER_EFFECT = {'F': 0.948, 'M': 1.02}
+AGE_EFFECT = {'0-17': 0.965, '18-25': 0.99, '26-35': 1.0, '36-45': 1.003, '46-50': 1.004,
+              '51-55': 1.022, '55+': 1.015}
+PURCHASE_RANGE = (12, 23961)
+# Rounds of redrawing out-of-range Purchase draws before the rest are clipped
+MAX_REDRAWS = 20
+# Original ratios of rows to distinct customers and products
+ROWS_PER_USER = 93
+ROWS_PER_PRODUCT = 151
+FIRST_USER_ID = 1000001
+SIZES = {'1M': 1_000_000, '10M': 10_000_000, '100M': 100_000_000}
+COLUMNS = ['User_ID', 'Product_ID', 'Gender', 'Age', 'Occupation', 'City_Category',
+           'Stay_In_Current_City_Years', 'Marital_Status', 'Product_Category', 'Purchase']
+
+
+def parse_rows(value):
+    """Row count from '1M', '10M', '100M', '250k' or a plain integer."""
+    text = str(value).strip().upper().replace('_', '')
+    for suffix, scale in (('M', 1_000_000), ('K', 1_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * scale)
+    return int(text)
+
+
+def _draw(rng, weights, size):
+    levels = list(weights)
+    p = np.asarray([weights[level] for level in levels], dtype=np.float64)
+    return np.asarray(levels, dtype=object)[rng.choice(len(levels), size=size, p=p / p.sum())]
+
+
+class Population:
+    """Customers and products shared by every generated chunk.
+
+    Each customer has fixed demographics and a heavy-tailed activity level; each product has
+    a category, a base price around its category's mean and a Zipf-like popularity, so
+    per-customer and per-product totals are as uneven as in real transaction logs.
+    """
+
+    def __init__(self, n_rows, seed=0):
+        rng = np.random.default_rng(np.random.SeedSequence([seed, 0]))
+        n_users = max(100, n_rows // ROWS_PER_USER)
+        n_products = max(50, n_rows // ROWS_PER_PRODUCT)
+
+        self.user_id = FIRST_USER_ID + np.arange(n_users)
+        self.gender = _draw(rng, GENDER_WEIGHTS, n_users)
+        self.age = _draw(rng, AGE_WEIGHTS, n_users)
+        self.occupation = _draw(rng, OCCUPATION_WEIGHTS, n_users).astype(np.int64)
+        self.city = _draw(rng, CITY_WEIGHTS, n_users)
+        self.stay = _draw(rng, STAY_WEIGHTS, n_users)
+        self.marital = _draw(rng, MARITAL_WEIGHTS, n_users).astype(np.int64)
+        self.user_effect = (pd.Series(self.gender).map(GENDER_EFFECT).to_numpy()
+                            * pd.Series(self.age).map(AGE_EFFECT).to_numpy())
+        activity = rng.lognormal(0.0, 1.0, n_users)
+        self.user_p = activity / activity.sum()
+
+        self.product_id = np.char.add('P', np.char.zfill(np.arange(1, n_products + 1).astype(str), 8))
+        category_weights = {category: count for category, (count, _) in PRODUCT_CATEGORIES.items()}
+        self.product_category = _draw(rng, category_weights, n_products).astype(np.int64)
+        category_mean = {category: mean for category, (_, mean) in PRODUCT_CATEGORIES.items()}
+        self.product_price = (pd.Series(self.product_category).map(category_mean).to_numpy()
+                              * rng.lognormal(0.0, 0.15, n_products))
+        popularity = 1.0 / np.arange(1, n_products + 1) ** 0.8
+        # Category frequencies are per transaction, so weight products within each category
+        for category, (count, _) in PRODUCT_CATEGORIES.items():
+            members = self.product_category == category
+            if members.any():
+                popularity[members] *= count / popularity[members].sum()
+        self.product_p = popularity / popularity.sum()
+
+    def sample(self, n, rng):
+        """A DataFrame of `n` transactions with the columns of walmart_data.csv."""
+        users = rng.choice(len(self.user_id), size=n, p=self.user_p)
+        products = rng.choice(len(self.product_id), size=n, p=self.product_p)
+        # Right-skewed noise around the product's price, shifted by the customer's demographics.
+        # Draws outside the original range are redrawn rather than clipped, which would pile
+        # them up at the bounds (about 1.6% of all rows at the maximum).
+        base = self.product_price[products] * self.user_effect[users]
+        purchase = np.rint(base * rng.lognormal(-0.04, 0.3, n))
+        low, high = PURCHASE_RANGE
+        for _ in range(MAX_REDRAWS):
+            outside = np.flatnonzero((purchase < low) | (purchase > high))
+            if not len(outside):
+                break
+            purchase[outside] = np.rint(base[outside] * rng.lognormal(-0.04, 0.3, len(outside)))
+        # Only products priced almost at a bound can still be outside after that
+        purchase = np.clip(purchase, low, high).astype(np.int64)
+        return pd.DataFrame({
+            'User_ID': self.user_id[users],
+            'Product_ID': self.product_id[products],
+            'Gender': pd.Categorical.from_codes(pd.Categorical(self.gender, GENDER_CATEGORIES).codes[users],
+                                                GENDER_CATEGORIES),
+            'Age': pd.Categorical.from_codes(pd.Categorical(self.age, AGE_CATEGORIES).codes[users], AGE_CATEGORIES),
+            'Occupation': self.occupation[users],
+            'City_Category': pd.Categorical.from_codes(pd.Categorical(self.city, CITY_CATEGORIES).codes[users],
+                                                       CITY_CATEGORIES),
+            'Stay_In_Current_City_Years': pd.Categorical.from_codes(
+                pd.Categorical(self.stay, STAY_CATEGORIES).codes[users], STAY_CATEGORIES),
+            'Marital_Status': self.marital[users],
+            'Product_Category': self.product_category[products],
+            'Purchase': purchase,
+        }, columns=COLUMNS)
+
+
+def generate(n_rows, seed=0, chunksize=1_000_000):
+    """Yield DataFrames of synthetic transactions, `chunksize` rows at a time, `n_rows` in total.
+
+    Chunk i is drawn from its own seed (seed, i + 1), so the output does not depend on how it
+    is consumed and 100M rows never have to be in memory at once.
+    """
+    population = Population(n_rows, seed)
+    for i, start in enumerate(range(0, n_rows, chunksize)):
+        rng = np.random.default_rng(np.random.SeedSequence([seed, i + 1]))
+        yield population.sample(min(chunksize, n_rows - start), rng)
+
+
+def write_csv(path, n_rows, seed=0, chunksize=1_000_000):
+    """Write `n_rows` synthetic transactions to `path` in chunks. Returns the path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
+        for i, chunk in enumerate(generate(n_rows, seed, chunksize)):
+            chunk.to_csv(f, header=(i == 0), index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate Black Friday-shaped synthetic transactions.")
+    parser.add_argument('path', help="Output CSV.")
+    parser.add_argument('--rows', default='1M', help=f"Row count, e.g. {', '.join(SIZES)} or 250k (default 1M).")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same file.")
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help="Rows generated and written at a time.")
+    args = parser.parse_args()
+    n_rows = parse_rows(args.rows)
+    write_csv(args.path, n_rows, seed=args.seed, chunksize=args.chunksize)
+    print(f"Wrote {n_rows:,} rows to {args.path}")